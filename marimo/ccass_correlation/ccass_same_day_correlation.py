@@ -30,7 +30,7 @@ def _():
     import plotly.graph_objects as go
     import altair as alt
 
-    return alt, mo, pl
+    return alt, datetime, mo, np, os, pl
 
 
 @app.cell
@@ -159,7 +159,7 @@ def _():
 
 
 @app.cell
-def _(mo):
+def _(datetime, mo):
     standard_symbol = mo.ui.dropdown(
         value="SEHK:02137",
         label="Standard Symbol for SEHK",
@@ -182,12 +182,20 @@ def _(mo):
     )
 
 
+    ccass_date_range = mo.ui.date_range(
+        start=datetime.date(2000, 1, 1),
+        stop=datetime.date.today(),
+        value=(datetime.date(2000, 1, 1), datetime.date.today()),
+        label="Ccass Date",
+    )
+
+
     mo.vstack(
         [
             mo.md('# Playground'),
             mo.hstack(
                 [
-                    standard_symbol,max_p_value
+                    standard_symbol,max_p_value,ccass_date_range
                 ],
                 justify="center",
                 align="stretch",
@@ -195,7 +203,7 @@ def _(mo):
             ),
         ]
     )
-    return max_p_value, standard_symbol
+    return ccass_date_range, max_p_value, standard_symbol
 
 
 @app.cell
@@ -209,19 +217,31 @@ def _(legend_dict, mo, standard_symbol):
 
 @app.cell
 def get_data_df(mo, pl):
-    shareholding_amount_df: pl.DataFrame = pl.read_csv(
-    str(mo.notebook_location().joinpath("public/hkex_ccass_stock_participant_shareholding.csv")),
-         schema_overrides={
-            "as_of_date_tz08": pl.Datetime,
-            "ccass_date": pl.Datetime,
-            # Add other column type overrides if needed
-        }
-    )
+    def read_public_table(name: str, **csv_kwargs) -> pl.DataFrame:
+        # Parquet copies are written at build time; fall back to the CSV when
+        # there is none. Missing files and failed fetches are OSErrors; a bad
+        # file should still raise
+        try:
+            return pl.read_parquet(
+                str(mo.notebook_location().joinpath(f"public/{name}.parquet"))
+            )
+        except OSError:
+            return pl.read_csv(
+                str(mo.notebook_location().joinpath(f"public/{name}.csv")),
+                **csv_kwargs,
+            )
 
 
+    SHAREHOLDING_SCHEMA_OVERRIDES = {
+        "as_of_date_tz08": pl.Datetime,
+        "ccass_date": pl.Datetime,
+        # Add other column type overrides if needed
+    }
+
 
-    stock_price_df = pl.read_csv(
-        str(mo.notebook_location().joinpath("public/stock_price.csv")),
+
+    stock_price_df = read_public_table(
+        "stock_price",
          schema_overrides={
             "as_of_date": pl.Datetime,
             # Add other column type overrides if needed
@@ -231,48 +251,167 @@ def get_data_df(mo, pl):
 
 
 
-    stock_name_df = pl.read_csv(
-       str( mo.notebook_location().joinpath("public/hkex_ccass_stock.csv"))
-
-    )
+    stock_name_df = read_public_table("hkex_ccass_stock")
 
 
-    hkex_ccass_participant_df = pl.read_csv(
-        str(mo.notebook_location().joinpath("public/hkex_ccass_participant.csv"))
-    )
+    hkex_ccass_participant_df = read_public_table("hkex_ccass_participant")
     return (
+        SHAREHOLDING_SCHEMA_OVERRIDES,
         hkex_ccass_participant_df,
-        shareholding_amount_df,
+        read_public_table,
         stock_name_df,
         stock_price_df,
     )
 
 
 @app.cell
-def _(mo, shareholding_amount_df: "pl.DataFrame", stock_price_df):
-    combined_data = mo.sql(
-        f"""
-        with add_scaled_shareholding_amount as (
+def shareholding_store(datetime, mo, os, pl):
+    from urllib.parse import quote as _quote
 
-            select *,
-                    case when max(shareholding_amount) over(partition by standard_symbol, participant_id) - min(shareholding_amount) over(partition by standard_symbol, participant_id) = 0 then 0 else   (shareholding_amount - min(shareholding_amount) over(partition by standard_symbol, participant_id)) / (max(shareholding_amount) over(partition by standard_symbol, participant_id) - min(shareholding_amount) over(partition by standard_symbol, participant_id)) end as scaled_shareholding_amount
-            from shareholding_amount_df
+    # Years of daily snapshots of every stock; kept out of the published public/ folder
+    SHAREHOLDING_STORE_DIR = os.environ.get(
+        "CCASS_SHAREHOLDING_STORE",
+        os.path.join(str(mo.notebook_dir()), "shareholding_store"),
+    )
+    SHAREHOLDING_ROW_GROUP_SIZE = 100_000
 
-        ), add_scaled_stock_price as (
 
-            select *,
-                   case when (max("close") over(partition by standard_symbol) - min("close") over(partition by standard_symbol)) = 0 then 0 else 
-                   ("close" - min("close") over(partition by standard_symbol))/ (max("close") over(partition by standard_symbol) - min("close") over(partition by standard_symbol)) end as scaled_close
+    def _store_partition(store_dir: str, symbol: str, year: int) -> str:
+        return os.path.join(
+            store_dir,
+            f"standard_symbol={_quote(symbol, safe='')}",
+            f"ccass_year={year}",
+            "part-0.parquet",
+        )
 
-            from stock_price_df
 
+    def write_shareholding_store(
+        shareholding: pl.DataFrame, store_dir: str = SHAREHOLDING_STORE_DIR
+    ) -> int:
+        """
+        Adds shareholding rows to the store: one Parquet file per symbol and
+        year of ccass_date, in the hive layout
+        `<store_dir>/standard_symbol=<symbol>/ccass_year=<year>/part-0.parquet`.
+
+        A partition's stored rows are merged with the new ones, the new row
+        winning for the same ccass_date and participant_id, and the file is
+        rewritten sorted by ccass_date. Each row group then covers a narrow
+        date range, so its statistics let a date filter skip it. Returns the
+        number of partitions written.
+        """
+        partitions = shareholding.with_columns(
+            ccass_year=pl.col("ccass_date").dt.year()
+        ).partition_by(["standard_symbol", "ccass_year"], as_dict=True, include_key=False)
+        for (symbol, year), rows in partitions.items():
+            path = _store_partition(store_dir, symbol, year)
+            if os.path.exists(path):
+                rows = pl.concat(
+                    [rows, pl.read_parquet(path, hive_partitioning=False)],
+                    how="diagonal_relaxed",
+                )
+            rows = rows.unique(
+                ["ccass_date", "participant_id"], keep="first", maintain_order=True
+            ).sort("ccass_date", "participant_id")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            rows.write_parquet(
+                f"{path}.tmp",
+                statistics=True,
+                row_group_size=SHAREHOLDING_ROW_GROUP_SIZE,
+            )
+            os.replace(f"{path}.tmp", path)
+        return len(partitions)
+
+
+    def filter_shareholding(shareholding, symbols=None, from_date=None, to_date=None):
+        """
+        The rows of `symbols` (all if None) with ccass_date from `from_date`
+        to `to_date` inclusive (open if None), of a DataFrame or LazyFrame.
+        """
+        if symbols is not None:
+            shareholding = shareholding.filter(pl.col("standard_symbol").is_in(symbols))
+        # On the column itself, so that its statistics can be used
+        if from_date is not None:
+            shareholding = shareholding.filter(
+                pl.col("ccass_date") >= datetime.datetime.combine(from_date, datetime.time())
             )
+        if to_date is not None:
+            shareholding = shareholding.filter(
+                pl.col("ccass_date")
+                < datetime.datetime.combine(to_date + datetime.timedelta(days=1), datetime.time())
+            )
+        return shareholding
+
+
+    def load_shareholding(
+        symbols=None, from_date=None, to_date=None, store_dir: str = SHAREHOLDING_STORE_DIR
+    ):
+        """
+        The stored rows of filter_shareholding, or None if the store is empty.
+
+        The filters are pushed down to the scan: only the partitions of the
+        symbols and years are opened, and in them only the row groups whose
+        ccass_date statistics overlap the date range are read.
+        """
+        if not os.path.isdir(store_dir) or not os.listdir(store_dir):
+            return None
+        shareholding = pl.scan_parquet(
+            os.path.join(store_dir, "**", "*.parquet"), hive_partitioning=True
+        )
+        # The years prune partitions; the dates prune row groups
+        if from_date is not None:
+            shareholding = shareholding.filter(pl.col("ccass_year") >= from_date.year)
+        if to_date is not None:
+            shareholding = shareholding.filter(pl.col("ccass_year") <= to_date.year)
+        return (
+            filter_shareholding(shareholding, symbols, from_date, to_date)
+            .drop("ccass_year")
+            .collect()
+        )
+    return (
+        SHAREHOLDING_STORE_DIR,
+        filter_shareholding,
+        load_shareholding,
+        write_shareholding_store,
+    )
 
+
+@app.cell
+def _(
+    SHAREHOLDING_SCHEMA_OVERRIDES,
+    ccass_date_range,
+    filter_shareholding,
+    load_shareholding,
+    mo,
+    read_public_table,
+    standard_symbol,
+):
+    # The screen needs every symbol; the playground only the selected one
+    _symbols = None if "screen" in mo.cli_args() else [standard_symbol.value]
+
+    shareholding_amount_df = load_shareholding(_symbols, *ccass_date_range.value)
+    if shareholding_amount_df is None:
+        # No store; the published notebook reads its public table whole
+        shareholding_amount_df = filter_shareholding(
+            read_public_table(
+                "hkex_ccass_stock_participant_shareholding",
+                schema_overrides=SHAREHOLDING_SCHEMA_OVERRIDES,
+            ),
+            _symbols,
+            *ccass_date_range.value,
+        )
+    return (shareholding_amount_df,)
+
+
+@app.cell
+def _(mo, shareholding_amount_df: "pl.DataFrame", stock_price_df):
+    # Shareholding joined with the close price on the same day; the
+    # statistics need no scaling, so none is done here
+    combined_data = mo.sql(
+        f"""
         select p.*,
-               q."close",
-               q."scaled_close" 
-        from add_scaled_shareholding_amount p
-        inner join add_scaled_stock_price q
+               q."close"
+        from shareholding_amount_df p
+        inner join stock_price_df q
         on p.as_of_date_tz08 = q.as_of_date
         and p.standard_symbol = q.standard_symbol
         order by p.as_of_date_tz08
@@ -476,21 +615,80 @@ def _(correlation_chart, legend_dict, mo, participant_id, standard_symbol):
     return
 
 
+@app.cell
+def _(
+    mo,
+    participant_id,
+    shareholding_amount_df: "pl.DataFrame",
+    standard_symbol,
+    stock_price_df,
+):
+    # Min-max scaled over the selected partitions only: the dropdowns filter
+    # the rows first, and each partition's min and max are aggregated once
+    # and joined back
+    filtered_combined_data = mo.sql(
+        f"""
+        with selected_shareholding_amount as (
+
+            select *
+            from shareholding_amount_df
+            where standard_symbol = '{standard_symbol.value}'
+            and participant_id = '{participant_id.value}'
+
+        ), shareholding_amount_range as (
+
+            select standard_symbol,
+                   participant_id,
+                   min(shareholding_amount) as min_shareholding_amount,
+                   max(shareholding_amount) as max_shareholding_amount
+            from selected_shareholding_amount
+            group by standard_symbol, participant_id
+
+        ), selected_stock_price as (
+
+            select *
+            from stock_price_df
+            where standard_symbol = '{standard_symbol.value}'
+
+        ), close_range as (
+
+            select standard_symbol,
+                   min("close") as min_close,
+                   max("close") as max_close
+            from selected_stock_price
+            group by standard_symbol
+
+            )
+
+        select p.*,
+               case when r.max_shareholding_amount - r.min_shareholding_amount = 0 then 0 else (p.shareholding_amount - r.min_shareholding_amount) / (r.max_shareholding_amount - r.min_shareholding_amount) end as scaled_shareholding_amount,
+               q."close",
+               case when c.max_close - c.min_close = 0 then 0 else (q."close" - c.min_close) / (c.max_close - c.min_close) end as scaled_close
+        from selected_shareholding_amount p
+        inner join shareholding_amount_range r
+        on p.standard_symbol = r.standard_symbol
+        and p.participant_id = r.participant_id
+        inner join selected_stock_price q
+        on p.as_of_date_tz08 = q.as_of_date
+        and p.standard_symbol = q.standard_symbol
+        inner join close_range c
+        on q.standard_symbol = c.standard_symbol
+        order by p.as_of_date_tz08
+        """,
+        output=False
+    )
+    return (filtered_combined_data,)
+
+
 @app.cell
 def _(
     alt,
-    combined_data,
+    filtered_combined_data,
     participant_id,
     participant_name,
-    pl,
     standard_symbol,
     stock_name,
 ):
-    filtered_combined_data = combined_data.filter(
-        (pl.col("standard_symbol") == standard_symbol.value) & 
-        (pl.col("participant_id") == participant_id.value)
-    )
-
     title = f"""{standard_symbol.value} ({stock_name}): {participant_id.value} ({participant_name}) Correlation with Stock Price"""
 
     # Base chart for the first line (scaled_close)
@@ -523,65 +721,484 @@ def _(
 
 
 @app.cell
-def _(combined_data, max_p_value, pl):
-    from scipy import stats
+def _(mo):
+    max_lag = mo.ui.slider(
+        start=0, stop=250, step=5, value=250, label="Max lag (trading days)"
+    )
 
-    dimensions = [
-        "standard_symbol",
-        "participant_id",
-        "stock_name",
-        "participant_name",
-    ]
+    mo.vstack(
+        [
+            mo.md(
+                """
+            ## Lead-Lag Correlation
+
+            The Spearman's rank above compares shareholding and price on the same day, but smart money may be early by months. For every participant, the shareholding is correlated with the price every number of trading days later, up to the max lag, and the lag with the smallest p-value is kept. A positive lag means the shareholding leads the price; a negative one, that it follows the price.
+
+            - X-axis: the best lag in trading days.
+            - Y-axis: the Spearman's rank at that lag. Highlighted participants are significant at the selected p value, after adjusting for the number of lags tried.
+            """
+            ),
+            max_lag,
+        ]
+    )
+    return (max_lag,)
+
+
+@app.cell
+def _(combined_data, dimensions, lead_lag_scan, max_lag):
+    # Every participant's best lag; the significance threshold is applied
+    # below, so changing it does not scan again
+    lead_lag_scan_data = lead_lag_scan(
+        combined_data, dimensions, "shareholding_amount", "close", max_lag=max_lag.value
+    )
+    return (lead_lag_scan_data,)
+
+
+@app.cell
+def _(alt, lead_lag_scan_data, max_p_value, pl, standard_symbol, stock_name):
+    lead_lag_data = lead_lag_scan_data.filter(
+        pl.col("standard_symbol") == standard_symbol.value
+    ).with_columns(
+        can_reject_null_hypothesis=pl.col("best_lag_adjusted_p_value")
+        <= float(max_p_value.value)
+    )
+
+    (
+        alt.Chart(lead_lag_data.drop_nulls("best_lag"))
+        .mark_circle(size=60)
+        .encode(
+            x=alt.X("best_lag:Q", title="Best Lag (trading days)"),
+            y=alt.Y("best_lag_correlation:Q", title="Spearman's Rank at Best Lag"),
+            tooltip=lead_lag_data.columns,
+            color=alt.condition(
+                "datum.can_reject_null_hypothesis === true",
+                alt.value("darkblue"),
+                alt.value("lightgray"),
+            ),
+        )
+        .properties(
+            title=f"Best Lag for {standard_symbol.value} ({stock_name})"
+        )
+        .interactive()
+    )
+    return (lead_lag_data,)
 
-    # Group by dimensions and calculate average shareholding amount
-    grouped = (
-        combined_data
-        .group_by(dimensions)
-        .agg(
-            pl.col("shareholding_amount").mean().alias("average_shareholding_amount")
+
+@app.cell
+def _(
+    alt,
+    combined_data,
+    dimensions,
+    lead_lag_scan,
+    max_lag,
+    participant_id,
+    pl,
+    standard_symbol,
+):
+    # Every lag of the selected participant
+    (
+        alt.Chart(
+            lead_lag_scan(
+                combined_data.filter(
+                    (pl.col("standard_symbol") == standard_symbol.value)
+                    & (pl.col("participant_id") == participant_id.value)
+                ),
+                dimensions,
+                "shareholding_amount",
+                "close",
+                max_lag=max_lag.value,
+                profile=True,
+            )
         )
+        .mark_line()
+        .encode(
+            x=alt.X("lag:Q", title="Lag (trading days)"),
+            y=alt.Y("correlation:Q", title="Spearman's Rank"),
+            tooltip=["lag", "correlation", "p_value", "observations"],
+        )
+        .properties(
+            title=f"{participant_id.value}: Spearman's Rank by Lag"
+        )
+        .interactive()
     )
+    return
+
 
-    def calculate_spearman(df: pl.DataFrame) -> pl.DataFrame:
-        correlation, p_value = stats.spearmanr(
-            df["shareholding_amount"], 
-            df["close"]
+@app.cell
+def spearman_engine(np, pl):
+    from scipy import special
+
+
+    def grouped_spearman(df: pl.DataFrame, by: list, x: str, y: str) -> pl.DataFrame:
+        """
+        Spearman's rank correlation of `x` and `y` within every group of `by`,
+        with its two-sided p-value, as scipy.stats.spearmanr computes them.
+
+        Ties get their average rank, as in scipy. Each group is ranked with
+        rank().over(by) and the Pearson correlation of the ranks is reduced
+        from grouped sums, so no Python runs per group. The p-values come
+        from the t-distribution in one NumPy call. Like scipy, a group with
+        fewer than 2 rows, a constant input or a NaN is NaN.
+        """
+        def _is_nan(column):
+            return pl.col(column).cast(pl.Float64).fill_null(float("nan")).is_nan()
+
+        # The mean of the average ranks 1..n is exactly (n + 1) / 2
+        mean_rank = (pl.len().over(by) + 1) / 2
+        ranked = df.select(
+            *by,
+            has_nan=_is_nan(x) | _is_nan(y),
+            rank_x=pl.col(x).rank("average").over(by) - mean_rank,
+            rank_y=pl.col(y).rank("average").over(by) - mean_rank,
         )
-    
-        # Create a dictionary with the existing results
-        result = {
-            "spearmans_correlation": [correlation],
-            "spearmans_p_value": [p_value],
-            "can_reject_null_hypothesis": [p_value <= float(max_p_value.value)]
-        }
-    
-        # Add all columns from dimensions to the result
-        for dimension in dimensions:
-            # We take the first value since we're grouping and want to keep the dimension value
-            result[dimension] = [df[dimension][0]]
-    
-        return pl.DataFrame(result)
+        sums = ranked.group_by(by, maintain_order=True).agg(
+            pl.len().alias("n"),
+            pl.col("has_nan").any(),
+            (pl.col("rank_x") * pl.col("rank_y")).sum().alias("sxy"),
+            (pl.col("rank_x") ** 2).sum().alias("sxx"),
+            (pl.col("rank_y") ** 2).sum().alias("syy"),
+        )
+
+        n = sums["n"].to_numpy().astype(np.float64)
+        sxx = sums["sxx"].to_numpy()
+        syy = sums["syy"].to_numpy()
+        undefined = (n <= 1) | (sxx == 0) | (syy == 0) | sums["has_nan"].to_numpy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            correlation = np.clip(sums["sxy"].to_numpy() / np.sqrt(sxx * syy), -1, 1)
+        correlation[undefined] = np.nan
+
+        return sums.select(by).with_columns(
+            spearmans_correlation=pl.Series(correlation, nan_to_null=False),
+            spearmans_p_value=pl.Series(
+                spearman_p_value(correlation, n), nan_to_null=False
+            ),
+        )
+
+
+    def spearman_p_value(correlation, n):
+        """
+        Two-sided p-values of Spearman's correlations over `n` observations,
+        from the t-distribution with n - 2 degrees of freedom, as in scipy.
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dof = n - 2
+            t = correlation * np.sqrt(
+                (dof / ((correlation + 1.0) * (1.0 - correlation))).clip(0)
+            )
+        return 2 * special.stdtr(dof, -np.abs(t))
+    return grouped_spearman, spearman_p_value
+
 
-    # Calculate Spearman correlation for each group
-    spearman_results = (
-        combined_data
-        .group_by(*dimensions, maintain_order=True)
-        .map_groups(lambda group_df: calculate_spearman(group_df))
+@app.cell
+def lead_lag_engine(np, pl, spearman_p_value):
+    def _fft_length(span):
+        """A power of two that holds every lag of a `span`-day series unwrapped."""
+        return 1 << (2 * int(span)).bit_length()
+
+
+    def _lagged_sums(a, b, n_fft, at, multiple):
+        """
+        sum_t a[t] * b[t + lag] of every row, for the FFT positions `at` of
+        the lags, rounded to the nearest multiple of 1 / `multiple`.
+        """
+        sums = np.fft.irfft(np.conj(np.fft.rfft(a, n_fft)) * np.fft.rfft(b, n_fft), n_fft)
+        return np.rint(sums[:, at] * multiple) / multiple
+
+
+    def lead_lag_scan(
+        combined_data: pl.DataFrame,
+        dimensions: list,
+        x: str,
+        y: str,
+        max_lag: int = 250,
+        min_observations: int = 20,
+        profile: bool = False,
+        chunk_cells: int = 2**21,
+    ) -> pl.DataFrame:
+        """
+        Spearman's rank correlation of `x` with `y` `lag` trading days later,
+        for every lag from -max_lag to max_lag, within every group of
+        `dimensions`. A positive lag is `x` leading `y`. The trading days are
+        the symbol's dates in `combined_data`, so a day missing from a group
+        is a gap in its series rather than a step.
+
+        Each series is ranked once over its whole history. The sums behind
+        every lag's correlation come from six FFT cross-correlations of the
+        ranks and of where they are observed, so no lag re-joins the data.
+        Ranks are multiples of 1/2, so the sums are rounded back to multiples
+        of 1/4 and the correlations are free of FFT rounding. At lag 0 this is
+        Spearman's correlation; at other lags it is the correlation of the
+        whole-history ranks over the overlapping days, which approximates
+        Spearman's of the overlap. Lags with fewer than `min_observations`
+        overlapping days are left out.
+
+        Returns, per group, the best lag by p-value, the one with the largest
+        absolute correlation and then the shortest on ties, with its
+        correlation, p-value, observations and the p-value Bonferroni-adjusted
+        for the number of lags scanned. With `profile`,
+        returns every lag of every group instead.
+        """
+        series = (
+            combined_data.with_columns(pl.col(x, y).cast(pl.Float64).fill_nan(None))
+            .drop_nulls([x, y])
+            .with_columns(
+                day=pl.col("as_of_date_tz08").rank("dense").over("standard_symbol")
+            )
+            .group_by(dimensions, maintain_order=True)
+            .agg(
+                pl.col("day").cast(pl.Int64),
+                # Centred on the mean rank, (n + 1) / 2, to keep the sums small
+                (pl.col(x).rank("average") - (pl.len() + 1) / 2).alias("rank_x"),
+                (pl.col(y).rank("average") - (pl.len() + 1) / 2).alias("rank_y"),
+            )
+        )
+        length = series["day"].list.len().to_numpy().astype(np.int64)
+        day = series["day"].explode().to_numpy()
+        rank_x = series["rank_x"].explode().to_numpy()
+        rank_y = series["rank_y"].explode().to_numpy()
+        start = np.cumsum(length) - length
+        first_day = series["day"].list.min().to_numpy()
+        span = series["day"].list.max().to_numpy() - first_day + 1
+
+        # Lags by distance from 0, so that argmax prefers the shortest lag
+        lags = np.arange(-max_lag, max_lag + 1)
+        lags = lags[np.lexsort((lags, np.abs(lags)))]
+
+        n_groups = len(series)
+        correlation = np.full((n_groups, len(lags)), np.nan)
+        observations = np.zeros((n_groups, len(lags)))
+        # Groups of similar span share a chunk, to limit the padding
+        order = np.argsort(span, kind="stable")
+        chunk_start = 0
+        while chunk_start < n_groups:
+            groups = order[
+                chunk_start : chunk_start
+                + max(1, chunk_cells // _fft_length(span[order[chunk_start]]))
+            ]
+            # Sized again by its longest group
+            groups = groups[: max(1, chunk_cells // _fft_length(span[groups[-1]]))]
+            chunk_start += len(groups)
+            longest = int(span[groups[-1]])
+            n_fft = _fft_length(longest)
+
+            # The chunk's values, one row per group and one column per day
+            rows = np.repeat(np.arange(len(groups)), length[groups])
+            values = np.arange(len(rows)) + np.repeat(
+                start[groups] - (np.cumsum(length[groups]) - length[groups]),
+                length[groups],
+            )
+            columns = day[values] - np.repeat(first_day[groups], length[groups])
+            observed = np.zeros((len(groups), longest))
+            ranked_x = np.zeros((len(groups), longest))
+            ranked_y = np.zeros((len(groups), longest))
+            observed[rows, columns] = 1
+            ranked_x[rows, columns] = rank_x[values]
+            ranked_y[rows, columns] = rank_y[values]
+
+            in_range = np.flatnonzero(np.abs(lags) < longest)
+            at = lags[in_range] % n_fft
+            n = _lagged_sums(observed, observed, n_fft, at, 1)
+            sx = _lagged_sums(ranked_x, observed, n_fft, at, 2)
+            sy = _lagged_sums(observed, ranked_y, n_fft, at, 2)
+            sxx = _lagged_sums(ranked_x**2, observed, n_fft, at, 4)
+            syy = _lagged_sums(observed, ranked_y**2, n_fft, at, 4)
+            sxy = _lagged_sums(ranked_x, ranked_y, n_fft, at, 4)
+
+            # n times the (co)variances, exact for these sums
+            vx = n * sxx - sx**2
+            vy = n * syy - sy**2
+            with np.errstate(divide="ignore", invalid="ignore"):
+                r = np.clip((n * sxy - sx * sy) / np.sqrt(vx * vy), -1, 1)
+            r[(n < max(min_observations, 3)) | (vx <= 0) | (vy <= 0)] = np.nan
+            correlation[np.ix_(groups, in_range)] = r
+            observations[np.ix_(groups, in_range)] = n
+
+        p_value = spearman_p_value(correlation, observations)
+        keys = series.select(dimensions)
+
+        if profile:
+            group, lag = np.nonzero(~np.isnan(correlation))
+            return keys[group].with_columns(
+                lag=pl.Series(lags[lag]),
+                correlation=pl.Series(correlation[group, lag]),
+                p_value=pl.Series(p_value[group, lag]),
+                observations=pl.Series(observations[group, lag].astype(np.int64)),
+            ).sort(*dimensions, "lag")
+
+        lags_scanned = (~np.isnan(correlation)).sum(axis=1)
+        # The most significant lag; on ties, e.g. p-values that underflow to
+        # 0, the strongest correlation, then the shortest lag
+        p = np.nan_to_num(p_value, nan=np.inf)
+        best = np.argmax(
+            np.where(
+                p == p.min(axis=1, keepdims=True),
+                np.nan_to_num(np.abs(correlation), nan=-1),
+                -np.inf,
+            ),
+            axis=1,
+        )
+        group = np.arange(n_groups)
+        return (
+            keys.with_columns(
+                best_lag=pl.Series(lags[best]),
+                best_lag_correlation=pl.Series(correlation[group, best], nan_to_null=False),
+                best_lag_p_value=pl.Series(p_value[group, best], nan_to_null=False),
+                best_lag_adjusted_p_value=pl.Series(
+                    np.minimum(p_value[group, best] * lags_scanned, 1), nan_to_null=False
+                ),
+                best_lag_observations=pl.Series(observations[group, best].astype(np.int64)),
+                has_lag=pl.Series(lags_scanned > 0),
+            )
+            # No best lag when no lag had enough observations
+            .with_columns(
+                pl.when(pl.col("has_lag")).then(pl.col(column)).alias(column)
+                for column in ["best_lag", "best_lag_observations"]
+            )
+            .drop("has_lag")
+        )
+    return (lead_lag_scan,)
+
+
+@app.cell
+def correlation_screen(grouped_spearman, mo, os, pl):
+    # Written by `--screen`; one Parquet file per symbol
+    CORRELATION_SCREEN_DIR = str(
+        mo.notebook_location() / "public" / "correlation_screen"
+    )
+
+
+    def screen_correlations(
+        combined_data: pl.DataFrame, dimensions: list, windows: tuple = (None,)
+    ) -> pl.DataFrame:
+        """
+        For every group of `dimensions` and every window: the average
+        shareholding amount, the number of observations and the Spearman's
+        rank correlation of shareholding amount with close price.
+
+        `windows` are lengths in days, ending on each symbol's last date;
+        None is the whole history. Rows are labelled by `window`, "all" or
+        "<days>d".
+        """
+        last_date = pl.col("as_of_date_tz08").max().over("standard_symbol")
+        screens = []
+        for days in windows:
+            rows = combined_data
+            if days is not None:
+                rows = rows.filter(
+                    pl.col("as_of_date_tz08") > last_date - pl.duration(days=days)
+                )
+            summary = rows.group_by(dimensions).agg(
+                pl.col("shareholding_amount").mean().alias("average_shareholding_amount"),
+                pl.len().alias("observations"),
+                pl.col("as_of_date_tz08").min().alias("window_start"),
+                pl.col("as_of_date_tz08").max().alias("window_end"),
+            )
+            screens.append(
+                summary.join(
+                    grouped_spearman(rows, dimensions, "shareholding_amount", "close"),
+                    on=dimensions,
+                ).with_columns(window=pl.lit("all" if days is None else f"{days}d"))
+            )
+        return pl.concat(screens)
+
+
+    def _screen_partition(screen_dir: str, symbol: str) -> str:
+        # Static hosts decode a percent-encoded ":" in the URL, so the file
+        # would not be found under its quoted name; "SEHK:00001" is "SEHK_00001"
+        return f"{screen_dir}/standard_symbol={symbol.replace(':', '_')}/part-0.parquet"
+
+
+    def write_correlation_screen(screen: pl.DataFrame, screen_dir: str) -> int:
+        """
+        Writes the screen as Parquet partitioned by symbol, in the hive layout
+        `<screen_dir>/standard_symbol=<symbol>/part-0.parquet`, with ":" in
+        the symbol written as "_". Each symbol's file is replaced whole.
+        Returns the number of symbols written.
+        """
+        partitions = screen.partition_by(
+            "standard_symbol", as_dict=True, include_key=False
+        )
+        for (symbol,), rows in partitions.items():
+            path = _screen_partition(screen_dir, symbol)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            rows.write_parquet(f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+        return len(partitions)
+
+
+    def read_correlation_screen(symbol: str, screen_dir: str = CORRELATION_SCREEN_DIR):
+        """The screen rows of one symbol, or None if it was not screened."""
+        try:
+            rows = pl.read_parquet(_screen_partition(screen_dir, symbol))
+        except OSError:
+            return None
+        return rows.with_columns(standard_symbol=pl.lit(symbol))
+    return (
+        CORRELATION_SCREEN_DIR,
+        read_correlation_screen,
+        screen_correlations,
+        write_correlation_screen,
     )
 
 
-    # Join the two results
+@app.cell
+def _(
+    CORRELATION_SCREEN_DIR,
+    ccass_date_range,
+    combined_data,
+    max_p_value,
+    mo,
+    pl,
+    read_correlation_screen,
+    screen_correlations,
+    standard_symbol,
+):
+    dimensions = [
+        "standard_symbol",
+        "participant_id",
+        "stock_name",
+        "participant_name",
+    ]
+
+    # Screened symbols are read from the precomputed screen, which covers
+    # their whole history; otherwise, or for a narrower date range, every
+    # symbol of the loaded data is computed on the fly
+    statistics_data = None
+    if ccass_date_range.value == (ccass_date_range.start, ccass_date_range.stop):
+        statistics_data = read_correlation_screen(standard_symbol.value)
+        if statistics_data is None and not mo.running_in_notebook():
+            print(
+                f"No correlation screen of {standard_symbol.value} in "
+                f"{CORRELATION_SCREEN_DIR}, computing it instead"
+            )
+    if statistics_data is not None:
+        # A screen written without the `all` window has no whole-history rows
+        statistics_data = statistics_data.filter(pl.col("window") == "all")
+        if statistics_data.is_empty():
+            statistics_data = None
+    if statistics_data is None:
+        statistics_data = screen_correlations(combined_data, dimensions)
+
     statistics_data = (
-        grouped
-        .join(spearman_results, on=dimensions)
+        statistics_data
+        .select(
+            *dimensions,
+            "average_shareholding_amount",
+            "observations",
+            "spearmans_correlation",
+            "spearmans_p_value",
+        )
+        .with_columns(
+            can_reject_null_hypothesis=pl.col("spearmans_p_value")
+            <= float(max_p_value.value)
+        )
         .sort("average_shareholding_amount", descending=True)
         .with_columns(
             pl.col("spearmans_correlation").fill_nan(0),
             pl.col("spearmans_p_value").fill_nan(100)
-        
-    )
+        )
     )
-    return (statistics_data,)
+    return dimensions, statistics_data
 
 
 @app.cell
@@ -623,5 +1240,94 @@ def _(mo):
     return
 
 
+@app.cell(hide_code=True)
+def _(mo):
+    mo.md(
+        r"""
+    # Market-wide Screen
+
+    The playground computes the correlations of the loaded symbols in the browser. To screen every stock, run the notebook headless:
+
+    ```
+    python ccass_same_day_correlation.py --screen [<dir>] [--windows all,365,90]
+    ```
+
+    For every stock, participant and window, the screen computes the Spearman's rank correlation and p-value, the average shareholding amount and the number of observations. Each window is a number of days ending on the stock's last date, or `all` for the whole history. The results are written as Parquet partitioned by symbol, to `public/correlation_screen/` by default. The playground then reads the precomputed rows of the selected symbol instead of computing them.
+    """
+    )
+    return
+
+
+@app.cell
+def _(
+    CORRELATION_SCREEN_DIR,
+    combined_data,
+    dimensions,
+    mo,
+    screen_correlations,
+    write_correlation_screen,
+):
+    if "screen" in mo.cli_args():
+        _screen_dir = mo.cli_args().get("screen") or CORRELATION_SCREEN_DIR
+        _windows = tuple(
+            None if _window == "all" else int(_window)
+            for _window in str(mo.cli_args().get("windows", "all")).split(",")
+        )
+        _screen = screen_correlations(combined_data, dimensions, _windows)
+        print(
+            {
+                "screen_rows": len(_screen),
+                "symbols": write_correlation_screen(_screen, _screen_dir),
+                "screen_dir": _screen_dir,
+            }
+        )
+    return
+
+
+@app.cell(hide_code=True)
+def _(mo):
+    mo.md(
+        r"""
+    # Shareholding Store
+
+    Years of daily CCASS snapshots of every stock are too many rows to read whole. They are kept in a Parquet store instead, partitioned by symbol and by year of `ccass_date`, each file sorted by `ccass_date`:
+
+    ```
+    python ccass_same_day_correlation.py --ingest <shareholding csv or parquet> [--store <dir>]
+    ```
+
+    Ingesting merges the rows into the store, by default `shareholding_store/` next to the notebook or `$CCASS_SHAREHOLDING_STORE`. With a store, the playground loads only the selected symbol and ccass date range: the other partitions are never opened, and the row groups outside the date range are skipped by their statistics.
+    """
+    )
+    return
+
+
+@app.cell
+def _(
+    SHAREHOLDING_SCHEMA_OVERRIDES,
+    SHAREHOLDING_STORE_DIR,
+    mo,
+    pl,
+    write_shareholding_store,
+):
+    _ingest_path = mo.cli_args().get("ingest")
+    if _ingest_path:
+        _store_dir = mo.cli_args().get("store") or SHAREHOLDING_STORE_DIR
+        if str(_ingest_path).endswith(".parquet"):
+            _shareholding = pl.read_parquet(_ingest_path)
+        else:
+            _shareholding = pl.read_csv(
+                _ingest_path, schema_overrides=SHAREHOLDING_SCHEMA_OVERRIDES
+            )
+        print(
+            {
+                "ingested_rows": len(_shareholding),
+                "partitions": write_shareholding_store(_shareholding, _store_dir),
+                "store_dir": _store_dir,
+            }
+        )
+    return
+
+
 if __name__ == "__main__":
     app.run()
@@ -11,6 +11,7 @@
 #     "polars==1.40.1",
 #     "pyarrow==24.0.0",
 #     "scikit-learn==1.8.0",
+#     "scipy==1.17.1",
 #     "sqlglot==30.6.0",
 #     "vegafusion>=2.0.3",
 #     "vl-convert-python==1.9.0.post1",
@@ -95,10 +96,16 @@ def _(mo):
 
 
 @app.cell
-def _(alt, mo):
-    with open(mo.notebook_location() / "public" / "correlation_of_historical_departure_on_employees_next_month_departure.json", "r") as f:
-        _chart_jsonspec = f.read()
-    _correlation_chart = alt.Chart.from_json(_chart_jsonspec)
+def _(alt, load_precomputed, mo, turnover_probability_chart):
+    # Only precomputed inputs, so that the published notebook shows the result
+    # without loading the register
+    _metrics = load_precomputed("turnover_correlation_metrics_2003_to_2026")
+    if _metrics is not None:
+        _correlation_chart = turnover_probability_chart(_metrics)
+    else:
+        with open(mo.notebook_location() / "public" / "correlation_of_historical_departure_on_employees_next_month_departure.json", "r") as f:
+            _chart_jsonspec = f.read()
+        _correlation_chart = alt.Chart.from_json(_chart_jsonspec)
     correlation_chart = mo.ui.altair_chart(_correlation_chart)
 
     mo.vstack(
@@ -175,49 +182,321 @@ def _():
 
 @app.cell
 def _():
+    import os
+    import numpy as np
     import pandas as pd
     import marimo as mo
     import altair as alt
-    from copy import deepcopy
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    return alt, mo, np, os, pa, pc, pd, pq
 
 
-    def load_dataset():
-        sfc_licenses = pd.read_csv(
-            mo.notebook_location() / "public" / "sfc_licences_2026.csv"
-        )
+@app.cell
+def _(mo, pa, pc, pd, pq):
+    import pyarrow.csv as pa_csv
+    import pyarrow.dataset as pa_ds
 
-        # 1. Convert to datetime objects first (keep as datetime64[ns] for easier manipulation)
-        sfc_licenses["effectiveDate"] = pd.to_datetime(
-            sfc_licenses["effectiveDate"]
+    # The register columns the notebook uses, and their types
+    SFC_LICENCE_SCHEMA = pa.schema(
+        [
+            ("sfcid", pa.string()),
+            ("fullName", pa.string()),
+            ("prinCeName", pa.string()),
+            ("effectiveDate", pa.date32()),
+            ("endDate", pa.date32()),
+        ]
+    )
+    # Rough size of a register CSV row, to size CSV blocks in rows
+    SFC_LICENCE_CSV_ROW_BYTES = 160
+
+
+    def _read_register_chunks(location, chunk_rows):
+        """Yields the projected register in record batches of about `chunk_rows`."""
+        columns = SFC_LICENCE_SCHEMA.names
+        if "://" in str(location):
+            # In the browser the register is only reachable by URL, which
+            # pyarrow's file readers do not open
+            yield from pa.Table.from_pandas(
+                pd.read_csv(location / "sfc_licences_2026.csv", usecols=columns, dtype=str),
+                preserve_index=False,
+            ).to_batches(max_chunksize=chunk_rows)
+            return
+
+        try:
+            # A typed Parquet copy is written at build time
+            parquet_file = pq.ParquetFile(str(location / "sfc_licences_2026.parquet"))
+        except FileNotFoundError:
+            parquet_file = None
+        if parquet_file is not None:
+            yield from parquet_file.iter_batches(batch_size=chunk_rows, columns=columns)
+            return
+
+        reader = pa_csv.open_csv(
+            str(location / "sfc_licences_2026.csv"),
+            read_options=pa_csv.ReadOptions(
+                block_size=chunk_rows * SFC_LICENCE_CSV_ROW_BYTES
+            ),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=columns, column_types=SFC_LICENCE_SCHEMA
+            ),
         )
-        sfc_licenses["endDate"] = pd.to_datetime(sfc_licenses["endDate"])
+        yield from reader
 
-        # 2. Create extra columns snapped to Jan 1st of the respective year
-        # This replaces the need for .replace(month=1, day=1)
-        sfc_licenses["license_year_created"] = (
-            sfc_licenses["effectiveDate"].dt.to_period("Y").dt.to_timestamp()
+
+    def load_dataset(chunk_rows=100_000, spill_to=None):
+        """
+        Streams the licence register chunk by chunk, reading only the columns
+        of SFC_LICENCE_SCHEMA and keeping the dates as date32.
+
+        Returns a DataFrame of pyarrow-backed columns. With `spill_to`, each
+        chunk is appended to that Parquet file instead, and a pyarrow dataset
+        over it is returned, so loading never holds more than a chunk. This
+        bounds the load only: the cells after it still read the columns they
+        use into memory, merge_licence_periods in particular.
+        """
+        schema = SFC_LICENCE_SCHEMA.append(
+            pa.field("license_year_created", pa.date32())
+        ).append(pa.field("license_year_terminated", pa.date32()))
+        writer = (
+            pq.ParquetWriter(spill_to, schema, compression="zstd")
+            if spill_to is not None
+            else None
         )
-        sfc_licenses["license_year_terminated"] = (
-            sfc_licenses["endDate"].dt.to_period("Y").dt.to_timestamp()
+
+        chunks = []
+        for batch in _read_register_chunks(mo.notebook_location() / "public", chunk_rows):
+            chunk = (
+                pa.Table.from_batches([batch])
+                .select(SFC_LICENCE_SCHEMA.names)
+                .cast(SFC_LICENCE_SCHEMA, safe=False)
+            )
+            # Create extra columns snapped to Jan 1st of the respective year
+            chunk = chunk.append_column(
+                schema.field("license_year_created"),
+                pc.floor_temporal(chunk["effectiveDate"], unit="year"),
+            ).append_column(
+                schema.field("license_year_terminated"),
+                pc.floor_temporal(chunk["endDate"], unit="year"),
+            )
+            if writer is not None:
+                writer.write_table(chunk)
+            else:
+                chunks.append(chunk)
+
+        if writer is not None:
+            writer.close()
+            return pa_ds.dataset(spill_to)
+        return pa.concat_tables(chunks or [schema.empty_table()]).to_pandas(
+            types_mapper=pd.ArrowDtype
         )
 
-        sfc_licenses["effectiveDate"] = sfc_licenses["effectiveDate"].dt.date
-        sfc_licenses["endDate"] = sfc_licenses["endDate"].dt.date
 
-        return sfc_licenses
+    # --spill-register <file.parquet> keeps the raw register out of memory
+    # while it loads, not while the history is built from it
+    sfc_licenses = load_dataset(spill_to=mo.cli_args().get("spill-register"))
+
+    sfc_licenses if isinstance(sfc_licenses, pd.DataFrame) else sfc_licenses.head(1_000)
+    return (sfc_licenses,)
 
 
-    sfc_licenses = load_dataset()
+@app.cell
+def _(alt, mo, os, pd):
+    # Cells named `precompute_*` are too heavy for the browser. They are run by
+    # `scripts/build.py --precompute`, which sets MARIMO_PRECOMPUTE=1 and stores
+    # what they return under public/precomputed/ for the published notebook.
+    is_precomputing = os.environ.get("MARIMO_PRECOMPUTE") == "1"
+    # The batch scripts in scripts/ only need the employment history; they
+    # set SFC_OUT_OF_CORE=1, so the cells holding the snapshot and its
+    # derivatives stop
+    OUT_OF_CORE = os.environ.get("SFC_OUT_OF_CORE") == "1"
+
+
+    def load_precomputed(name):
+        """Load a precomputed DataFrame or chart, or None if there is none."""
+        if is_precomputing:
+            return None
+
+        # Only a missing artifact is expected; a corrupt one should raise
+        location = mo.notebook_location() / "public" / "precomputed"
+        try:
+            return pd.read_parquet(str(location / f"{name}.parquet"))
+        except OSError:
+            pass
+        try:
+            with open(location / f"{name}.vl.json", "r") as _file:
+                return alt.Chart.from_json(_file.read())
+        except OSError:
+            return None
+    return OUT_OF_CORE, is_precomputing, load_precomputed
+
+
+@app.cell
+def _(mo):
+    def import_script(name):
+        """
+        Imports a module of the repository's scripts/ folder, where the batch
+        engines live; they are not part of the published notebook.
+        """
+        import importlib
+        import sys
+
+        scripts_dir = str(mo.notebook_dir().parents[1] / "scripts")
+        if scripts_dir not in sys.path:
+            sys.path.insert(0, scripts_dir)
+        return importlib.import_module(name)
+    return (import_script,)
+
+
+@app.cell
+def cell_result_cache(mo, os, pd):
+    import hashlib
+    import json
+    import time
+
+    # Results memoised on disk across sessions and widget changes; SFC_CACHE_DIR
+    # moves them, e.g. to a larger disk
+    NOTEBOOK_CACHE_DIR = os.environ.get(
+        "SFC_CACHE_DIR", os.path.join(str(mo.notebook_dir() or "."), "__marimo__", "cache")
+    )
+    CELL_CACHE_MAX_BYTES = int(os.environ.get("SFC_CELL_CACHE_MAX_BYTES", 2 * 1024**3))
+    CELL_CACHE_LOG = "cell_cache_log.jsonl"
+
+
+    def frame_fingerprint(df):
+        """A hash of the columns, dtypes and values of a DataFrame."""
+        digest = hashlib.sha256(repr(list(df.dtypes.astype(str).items())).encode())
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+        return digest.hexdigest()
+
+
+    def code_fingerprint(*functions):
+        """A hash of the bytecode and constants of `functions`."""
+        digest = hashlib.sha256()
+
+        def _update(code):
+            digest.update(code.co_code)
+            for constant in code.co_consts:
+                if hasattr(constant, "co_code"):
+                    _update(constant)
+                else:
+                    digest.update(repr(constant).encode())
+
+        for function in functions:
+            _update(function.__code__)
+        return digest.hexdigest()
+
+
+    def _evict_least_recently_used(cells_dir, max_bytes, keep):
+        entries = []
+        for entry in os.scandir(cells_dir):
+            if entry.name.endswith(".parquet"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= max_bytes:
+                break
+            if path != keep:
+                os.remove(path)
+                total_bytes -= size
+
+
+    def _log_lookup(cache_dir, **record):
+        try:
+            with open(os.path.join(cache_dir, CELL_CACHE_LOG), "a") as _file:
+                _file.write(json.dumps({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), **record}) + "\n")
+        except OSError:
+            pass
+
+
+    def cached_frame(name, key, compute, cache_dir=None, max_bytes=CELL_CACHE_MAX_BYTES):
+        """
+        Returns the DataFrame compute() returns, memoised on disk.
+
+        `key` describes everything the result depends on (input fingerprints,
+        code fingerprints, widget values) and must be JSON-serialisable.
+        Results are stored as Parquet under `<cache_dir>/cells/`. When they
+        total more than `max_bytes`, the least recently used ones are
+        evicted. Every lookup is logged as a hit or a miss to
+        `<cache_dir>/cell_cache_log.jsonl` (see read_cell_cache_log). Where
+        nothing can be written, e.g. in the browser, compute() is called
+        every time.
+        """
+        cache_dir = cache_dir or NOTEBOOK_CACHE_DIR
+        cells_dir = os.path.join(cache_dir, "cells")
+        digest = hashlib.sha256(
+            json.dumps([name, key], sort_keys=True, default=str).encode()
+        ).hexdigest()[:24]
+        path = os.path.join(cells_dir, f"{name}-{digest}.parquet")
+
+        started = time.perf_counter()
+        try:
+            result = pd.read_parquet(path)
+            # Mark as most recently used
+            os.utime(path)
+            hit = True
+        except (OSError, ValueError):
+            result = compute()
+            hit = False
+            try:
+                os.makedirs(cells_dir, exist_ok=True)
+                result.to_parquet(f"{path}.tmp", index=False)
+                os.replace(f"{path}.tmp", path)
+                _evict_least_recently_used(cells_dir, max_bytes, keep=path)
+            except OSError:
+                pass
+
+        _log_lookup(
+            cache_dir,
+            cell=name,
+            key=digest,
+            result="hit" if hit else "miss",
+            seconds=round(time.perf_counter() - started, 3),
+            bytes=os.path.getsize(path) if os.path.exists(path) else None,
+        )
+        return result
+
 
-    sfc_licenses
-    return alt, deepcopy, mo, pd, sfc_licenses
+    def read_cell_cache_log(cache_dir=None):
+        """The hit/miss log of cached_frame, one row per lookup."""
+        try:
+            return pd.read_json(
+                os.path.join(cache_dir or NOTEBOOK_CACHE_DIR, CELL_CACHE_LOG), lines=True
+            )
+        except (OSError, ValueError):
+            return pd.DataFrame(columns=["time", "cell", "key", "result", "seconds", "bytes"])
+    return (
+        NOTEBOOK_CACHE_DIR,
+        cached_frame,
+        code_fingerprint,
+        frame_fingerprint,
+        hashlib,
+        json,
+        read_cell_cache_log,
+        time,
+    )
 
 
 @app.cell
 def _(alt, mo, pd, sfc_licenses):
     # 1-4. (Your existing data processing)
 
-    unique_stints = sfc_licenses.drop_duplicates(
+    _licenses = sfc_licenses
+    if not isinstance(_licenses, pd.DataFrame):
+        # A register spilled to Parquet; load only the columns used here
+        _licenses = _licenses.to_table(
+            columns=[
+                "sfcid",
+                "effectiveDate",
+                "endDate",
+                "license_year_created",
+                "license_year_terminated",
+            ]
+        ).to_pandas(types_mapper=pd.ArrowDtype)
+
+    unique_stints = _licenses.drop_duplicates(
         subset=["sfcid", "effectiveDate", "endDate"]
     ).copy()
 
@@ -247,6 +526,8 @@ def _(alt, mo, pd, sfc_licenses):
 
 
     plot_data = pd.concat([created, terminated])
+    # The register keeps dates as date32; the yearly totals are small enough for datetimes
+    plot_data["year"] = plot_data["year"].astype("datetime64[ms]")
 
 
     # Pivot data to compare Created vs Terminated side-by-side
@@ -356,73 +637,397 @@ def _(mo):
 
     This differs from the methodology in the research paper, as evident from the statistics summary below.
 
-    Rationale is that, a single financial group often operates through multiple legal entities or branches, such as **Get Nice Futures Company Limited** and **Get Nice Securities Limited**. To ensure these are treated as a single continuous employer, we consolidated the records by matching the **first word** of the English company name. This heuristic allows us to accurately track professional movement between parent organizations without being misled by internal transfers between subsidiaries.
+    Rationale is that, a single financial group often operates through multiple legal entities or branches, such as **Get Nice Futures Company Limited** and **Get Nice Securities Limited**. To ensure these are treated as a single continuous employer, we consolidated the records by matching the **first distinctive word** of the English company name. This heuristic allows us to accurately track professional movement between parent organizations without being misled by internal transfers between subsidiaries.
+
+    Each registered institution is resolved to its company once, in a company resolution table: by default the **first word** of its name, read past generic leading words such as "Hong Kong" or "China" that unrelated groups share. Where the rules get a group wrong, a row in `public/company_overrides.csv` (`prinCeName,companyId`) maps the institution to the right company; only the consolidation step below is rerun when it changes.
 
     The result is basically an employment history of each SFC professional for each registered institution in SCD type 2 format (Slowly changing dimension Type 2). Each row shows the start date (effectiveDate) and end date (endDate) of the employment of an SFC professional at each registered institution.
     """)
     return
 
 
-@app.cell(hide_code=True)
-def _(mo, sfc_licenses):
-    sfc_professional_company_employment_history = mo.sql(
-        f"""
-        -- Step 1: Merge overlapping date ranges for the same sfcid and prinCeName.
-        -- This collapses multiple licenses at the same company into single continuous periods.
-        with merged_licenses as (
-            select 
-                sfcid, 
-                fullName, 
-                prinCeName, 
-                min(effectiveDate) as effectiveDate, 
-                max(endDate) as endDate
-            from (
-                select 
-                    *,
-                    sum(is_new_start) over (partition by sfcid, prinCeName order by effectiveDate, endDate) as overlap_grp
-                from (
-                    select 
-                        sfcid, fullName, prinCeName, effectiveDate, endDate,
-                        case when effectiveDate <= max(endDate) over (
-                            partition by sfcid, prinCeName 
-                            order by effectiveDate, endDate 
-                            rows between unbounded preceding and 1 preceding
-                        ) then 0 else 1 end as is_new_start
-                    from sfc_licenses
-                ) t1
-            ) t2
-            group by sfcid, fullName, prinCeName, overlap_grp
-        ),
-        -- Step 2: Group consecutive records where the company's first word is the same.
-        add_incre as (
-            select 
-                *,
-                case when lag(split_part(prinCeName, ' ', 1)) over (partition by sfcid order by effectiveDate, endDate, prinCeName) 
-                     is distinct from split_part(prinCeName, ' ', 1) 
-                     then 1 else 0 end as _incre,
-            from merged_licenses
-        ),
-        add_group as (
-            select 
-                *,
-                sum(_incre) over (partition by sfcid order by effectiveDate, endDate, prinCeName rows unbounded preceding) as grp
-            from add_incre
-        )
-        -- Step 3: Final aggregation
-        select 
-            sfcid,
-            fullName,
-            fullName || ' (' || sfcid || ') ' as professionalId,
-        	split_part(min(prinCeName), ' ', 1) as companyId,   
-            array_agg(distinct prinCeName) as princCeNames,
-            min(effectiveDate) as effectiveDate,
-            max(endDate) as endDate,
-            max(endDate) - min(effectiveDate) as tenure_days
-        from add_group
-        group by sfcid, fullName, grp
-        order by sfcid, min(effectiveDate)
+@app.cell
+def licence_interval_engine(np, pa, pc, pd, pl):
+    def _codes(values):
+        """Codes in string order, with missing values coded last."""
+        codes, uniques = pd.factorize(values, sort=True)
+        codes = np.where(codes < 0, len(uniques), codes)
+        return codes, pl.Series(uniques.to_numpy(dtype=object), dtype=pl.String).append(
+            pl.Series([None], dtype=pl.String)
+        )
+
+
+    def _days(values):
+        """Days since epoch as int64, -1 when missing."""
+        days = pc.cast(pa.array(values), pa.date32(), safe=False)
+        return pc.fill_null(pc.cast(pc.cast(days, pa.int32()), pa.int64()), -1).to_numpy()
+
+
+    def _sort_order(*keys):
+        """Stable row order sorting by `keys` (non-negative codes), first key first."""
+        composite = np.zeros(len(keys[0]), dtype=np.int64)
+        capacity = 1
+        for key in keys:
+            size = int(key.max(initial=0)) + 1
+            capacity *= size
+            if capacity >= 2**62:
+                return np.lexsort(keys[::-1])
+            composite = composite * size + key
+        return np.argsort(composite, kind="stable")
+
+
+    def _run_starts(*keys):
+        """Marks the first row of every run of equal keys in sorted rows."""
+        starts = np.ones(len(keys[0]), dtype=bool)
+        starts[1:] = False
+        for key in keys:
+            starts[1:] |= key[1:] != key[:-1]
+        return starts
+
+
+    def _reduce_runs(ufunc, values, starts):
+        return ufunc.reduceat(values, np.flatnonzero(starts)) if len(values) else values
+
+
+    def merge_licence_periods(licenses):
+        """
+        Merges the licences of a professional at the same firm that overlap
+        into periods, in one sorted pass: a licence starts a new period
+        unless it starts on or before the latest end date of the licences
+        sorted before it. A licence without an end date does not extend the
+        period it is in, and peers with the same dates fall into the same
+        period.
+
+        Returns the periods, with sfcid, fullName and prinCeName as codes into
+        the returned lookups (missing values coded last) and effectiveDate and
+        endDate as days since epoch (-1 when missing). Periods do not depend on
+        how firms are grouped into companies, so they are computed once per
+        register.
+        """
+        if not isinstance(licenses, pd.DataFrame):
+            # A register spilled to Parquet
+            licenses = licenses.to_table(
+                columns=["sfcid", "fullName", "prinCeName", "effectiveDate", "endDate"]
+            ).to_pandas(types_mapper=pd.ArrowDtype)
+
+        sfcid, sfcids = _codes(licenses["sfcid"])
+        full_name, full_names = _codes(licenses["fullName"])
+        firm, firms = _codes(licenses["prinCeName"])
+
+        # Dates as day offsets from the first date. A missing date sorts last
+        # (NULLS LAST) as `null_day`, and is ignored by max() as -1
+        effective, end = _days(licenses["effectiveDate"]), _days(licenses["endDate"])
+        present = np.concatenate([effective[effective >= 0], end[end >= 0]])
+        first_day = present.min(initial=0)
+        null_day = present.max(initial=0) - first_day + 1
+        effective = np.where(effective >= 0, effective - first_day, null_day)
+        end_for_max = np.where(end >= 0, end - first_day, -1)
+        end = np.where(end >= 0, end_for_max, null_day)
+
+        order = _sort_order(sfcid, firm, effective, end)
+        sfcid, full_name, firm = sfcid[order], full_name[order], firm[order]
+        effective, end, end_for_max = effective[order], end[order], end_for_max[order]
+
+        firm_starts = _run_starts(sfcid, firm)
+        # Running max of the end dates, restarting at every firm
+        firm_offset = (np.cumsum(firm_starts) - 1) * (null_day + 1)
+        latest_end = np.maximum.accumulate(end_for_max + 1 + firm_offset) - firm_offset - 1
+        previous_end = np.empty_like(latest_end)
+        previous_end[1:] = latest_end[:-1]
+        previous_end[firm_starts] = -1
+
+        is_new_start = ~(
+            (effective != null_day) & (previous_end >= 0) & (effective <= previous_end)
+        )
+        # Peers with the same dates share the running count of their last peer
+        new_starts = np.cumsum(is_new_start)
+        peer_starts = _run_starts(sfcid, firm, effective, end)
+        peer_last = np.flatnonzero(np.append(peer_starts[1:], len(order) > 0))
+        overlap_group = new_starts[peer_last][np.cumsum(peer_starts) - 1]
+
+        order = _sort_order(overlap_group, full_name)
+        period_starts = _run_starts(overlap_group[order], full_name[order])
+        first = order[period_starts]
+        effective = _reduce_runs(np.minimum, effective[order], period_starts)
+        end_for_max = _reduce_runs(np.maximum, end_for_max[order], period_starts)
+
+        periods = pd.DataFrame(
+            {
+                "sfcid": sfcid[first],
+                "fullName": full_name[first],
+                "prinCeName": firm[first],
+                "effectiveDate": np.where(effective != null_day, effective + first_day, -1),
+                "endDate": np.where(end_for_max >= 0, end_for_max + first_day, -1),
+            }
+        )
+        return periods, {"sfcid": sfcids, "fullName": full_names, "prinCeName": firms}
+
+
+    def consolidate_company_stints(periods, lookups, company_resolution=None):
+        """
+        Consolidates consecutive periods of a professional at firms of the
+        same company into one stint, in one sorted pass over the output of
+        merge_licence_periods.
+
+        Firms are grouped by the integer company_key of `company_resolution`
+        (see build_company_resolution), looked up once per firm. Without it,
+        firms are grouped by the first word of their name.
         """
+        sfcid = periods["sfcid"].to_numpy()
+        full_name = periods["fullName"].to_numpy()
+        firm = periods["prinCeName"].to_numpy()
+        firms = lookups["prinCeName"]
+
+        if company_resolution is None:
+            # split_part(prinCeName, ' ', 1); a missing firm name has no first word
+            firm_companies = firms.str.split(" ").list.first()
+            firm_keys = firm_companies[:-1].rank("dense").to_numpy() - 1
+        else:
+            position = pd.Index(company_resolution["prinCeName"]).get_indexer(
+                firms[:-1].to_numpy()
+            )
+            if (position < 0).any():
+                raise ValueError(
+                    f"{int((position < 0).sum())} firms are missing from the "
+                    "company resolution table"
+                )
+            firm_companies = pl.Series(
+                company_resolution["companyId"].to_numpy(dtype=object)[position],
+                dtype=pl.String,
+            ).append(pl.Series([None], dtype=pl.String))
+            firm_keys = company_resolution["company_key"].to_numpy()[position]
+        word = np.append(firm_keys, -1)[firm]
+
+        # Day offsets as in merge_licence_periods
+        effective = periods["effectiveDate"].to_numpy()
+        end_for_max = periods["endDate"].to_numpy()
+        present = np.concatenate([effective[effective >= 0], end_for_max[end_for_max >= 0]])
+        first_day = present.min(initial=0)
+        null_day = present.max(initial=0) - first_day + 1
+        effective = np.where(effective >= 0, effective - first_day, null_day)
+        end_for_max = np.where(end_for_max >= 0, end_for_max - first_day, -1)
+        end = np.where(end_for_max >= 0, end_for_max, null_day)
+
+        order = _sort_order(sfcid, effective, end, firm)
+        sfcid, full_name, firm, word = sfcid[order], full_name[order], firm[order], word[order]
+        effective, end, end_for_max = effective[order], end[order], end_for_max[order]
+
+        previous_word = np.empty_like(word)
+        previous_word[1:] = word[:-1]
+        previous_word[_run_starts(sfcid)] = -1
+        group = np.cumsum(word != previous_word)
+
+        # Sorting by firm too lists each stint's distinct firms in order
+        order = _sort_order(sfcid, group, full_name, firm)
+        sfcid, group, full_name, firm = sfcid[order], group[order], full_name[order], firm[order]
+        stint_starts = _run_starts(sfcid, group, full_name)
+        stint_effective = _reduce_runs(np.minimum, effective[order], stint_starts)
+        stint_end_for_max = _reduce_runs(np.maximum, end_for_max[order], stint_starts)
+        stint_firm = _reduce_runs(np.minimum, firm, stint_starts)
+
+        # Distinct firm names of every stint, as a list column
+        distinct_firms = _run_starts(np.cumsum(stint_starts), firm)
+        offsets = np.append(
+            np.cumsum(distinct_firms)[stint_starts] - 1, distinct_firms.sum()
+        )
+        princ_ce_names = pa.ListArray.from_arrays(
+            pa.array(offsets, type=pa.int32()),
+            firms.gather(firm[distinct_firms]).to_arrow(),
+        )
+
+        def _dates(days, missing):
+            return np.where(
+                days == missing,
+                np.datetime64("NaT"),
+                (days + first_day).astype("datetime64[D]"),
+            )
+
+        # Order by sfcid, effectiveDate, as the SQL did
+        sfcid, full_name = sfcid[stint_starts], full_name[stint_starts]
+        stint_end = np.where(stint_end_for_max >= 0, stint_end_for_max, null_day)
+        order = _sort_order(sfcid, stint_effective, stint_end)
+
+        history = pl.DataFrame(
+            {
+                "sfcid": lookups["sfcid"].gather(sfcid[order]),
+                "fullName": lookups["fullName"].gather(full_name[order]),
+                "companyId": firm_companies.gather(stint_firm[order]),
+                "princCeNames": pl.from_arrow(princ_ce_names.take(order)),
+                "effectiveDate": _dates(stint_effective[order], null_day),
+                "endDate": _dates(stint_end_for_max[order], -1),
+            }
+        )
+        return history.with_columns(
+            professionalId=pl.col("fullName") + " (" + pl.col("sfcid") + ") ",
+            tenure_days=(pl.col("endDate") - pl.col("effectiveDate")).dt.total_days(),
+        ).select(
+            "sfcid",
+            "fullName",
+            "professionalId",
+            "companyId",
+            "princCeNames",
+            "effectiveDate",
+            "endDate",
+            "tenure_days",
+        )
+
+
+    def coalesce_employment_history(licenses, company_resolution=None):
+        """
+        Turns the licence register into the employment history of every
+        professional: merge_licence_periods, then consolidate_company_stints.
+
+        Replaces an equivalent SQL query built on window functions, with the
+        same output when firms are grouped by the first word of their name.
+        """
+        periods, lookups = merge_licence_periods(licenses)
+        return consolidate_company_stints(periods, lookups, company_resolution)
+    return coalesce_employment_history, consolidate_company_stints, merge_licence_periods
+
+
+@app.cell
+def _(merge_licence_periods, sfc_licenses):
+    sfc_licence_periods, sfc_licence_lookups = merge_licence_periods(sfc_licenses)
+    return sfc_licence_lookups, sfc_licence_periods
+
+
+@app.cell
+def company_resolution(NOTEBOOK_CACHE_DIR, mo, np, os, pa, pd, pq):
+    # Bump when the rules below change, to invalidate cached resolutions
+    COMPANY_RULES_VERSION = 1
+    # Leading words shared by unrelated groups: a company name runs on past
+    # them to the first word that tells groups apart, so "Hong Kong X
+    # Securities" and "Hong Kong Y Futures" are two companies
+    COMPANY_GENERIC_LEADING_WORDS = ("The", "China", "Hong", "Kong", "HK", "Asia", "Pacific", "International")
+    COMPANY_RESOLUTION_CACHE = os.path.join(NOTEBOOK_CACHE_DIR, "company_resolution.parquet")
+
+
+    def company_by_rules(prin_ce_name, generic_words=COMPANY_GENERIC_LEADING_WORDS):
+        """The company of a firm by name: its first word not in `generic_words`, with the words before it."""
+        words = prin_ce_name.split(" ")
+        size = 1
+        while size < len(words) and words[size - 1] in generic_words:
+            size += 1
+        return " ".join(words[:size])
+
+
+    def load_company_overrides(location=None):
+        """
+        Reads the prinCeName,companyId pairs of company_overrides.csv, which
+        take precedence over the rules. Returns a prinCeName-indexed Series,
+        empty when there is no override file.
+        """
+        location = location or mo.notebook_location() / "public" / "company_overrides.csv"
+        try:
+            overrides = pd.read_csv(location, dtype=str)
+        except (OSError, ValueError):
+            return pd.Series(dtype=object, name="companyId")
+        overrides = overrides.dropna().drop_duplicates("prinCeName", keep="last")
+        return overrides.set_index("prinCeName")["companyId"].astype(object)
+
+
+    def _rules_key(generic_words):
+        return f"{COMPANY_RULES_VERSION}:{'|'.join(sorted(generic_words))}"
+
+
+    def _cached_rule_companies(generic_words, cache_path):
+        """Previously resolved firms, if they were resolved with the same rules."""
+        try:
+            cached = pq.read_table(cache_path)
+        except (OSError, pa.ArrowException):
+            return pd.Series(dtype=object)
+        if (cached.schema.metadata or {}).get(b"rules", b"").decode() != _rules_key(generic_words):
+            return pd.Series(dtype=object)
+        cached = cached.to_pandas()
+        return pd.Series(cached["companyId"].to_numpy(dtype=object), index=cached["prinCeName"])
+
+
+    def build_company_resolution(
+        firms,
+        overrides=None,
+        generic_words=COMPANY_GENERIC_LEADING_WORDS,
+        cache_path=COMPANY_RESOLUTION_CACHE,
+    ):
+        """
+        Maps every firm name in `firms` to its company, once per distinct name.
+
+        The rules resolve each name by company_by_rules; their results are
+        cached in `cache_path`, so only firms new to the register are
+        resolved again. `overrides` (see load_company_overrides) are applied
+        on top, so adding one re-resolves no firm and leaves the licence
+        periods as they are.
+
+        Returns a DataFrame with prinCeName, companyId, the source of each
+        mapping ("rules" or "override"), and company_key, a dense int32 code
+        of companyId to group firms on.
+        """
+        names = pd.Index(pd.Series(firms, dtype=object).dropna().unique())
+        rule_companies = _cached_rule_companies(generic_words, cache_path)
+        new_names = names.difference(rule_companies.index)
+        if len(new_names):
+            rule_companies = pd.concat(
+                [
+                    rule_companies,
+                    pd.Series(
+                        [company_by_rules(name, generic_words) for name in new_names],
+                        index=new_names,
+                        dtype=object,
+                    ),
+                ]
+            )
+            table = pa.table(
+                {
+                    "prinCeName": pa.array(rule_companies.index, pa.string()),
+                    "companyId": pa.array(rule_companies.to_numpy(), pa.string()),
+                }
+            ).replace_schema_metadata({"rules": _rules_key(generic_words)})
+            try:
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                pq.write_table(table, f"{cache_path}.tmp")
+                os.replace(f"{cache_path}.tmp", cache_path)
+            except OSError:
+                # A read-only location; resolve again next time
+                pass
+
+        company = rule_companies.reindex(names).to_numpy(dtype=object, copy=True)
+        overridden = (
+            names.isin(overrides.index) if overrides is not None else np.zeros(len(names), bool)
+        )
+        if overridden.any():
+            company[overridden] = overrides.reindex(names[overridden]).to_numpy(dtype=object)
+
+        company_key, _ = pd.factorize(company, sort=True)
+        return pd.DataFrame(
+            {
+                "prinCeName": names.to_numpy(dtype=object),
+                "companyId": company,
+                "source": np.where(overridden, "override", "rules"),
+                "company_key": company_key.astype(np.int32),
+            }
+        )
+    return build_company_resolution, company_by_rules, load_company_overrides
+
+
+@app.cell
+def _(build_company_resolution, load_company_overrides, sfc_licence_lookups):
+    sfc_company_resolution = build_company_resolution(
+        sfc_licence_lookups["prinCeName"], load_company_overrides()
+    )
+    return (sfc_company_resolution,)
+
+
+@app.cell(hide_code=True)
+def _(
+    consolidate_company_stints,
+    sfc_company_resolution,
+    sfc_licence_lookups,
+    sfc_licence_periods,
+):
+    sfc_professional_company_employment_history = consolidate_company_stints(
+        sfc_licence_periods, sfc_licence_lookups, sfc_company_resolution
     )
+
+    sfc_professional_company_employment_history
     return (sfc_professional_company_employment_history,)
 
 
@@ -491,7 +1096,7 @@ def _(mo, pl, sfc_professional_company_employment_history):
             mo.md(
                 f"""
         **Analysis of Methodology Differences:**
-        The differences between these results and the research table are primarily due to the **Corporate Group Consolidation** preprocessing and the extended observation window. By grouping entities by the first word of their name (e.g., merging "Get Nice Securities" and "Get Nice Futures"), internal transfers within the same financial group are no longer counted as new employment records or exits. This leads to a significant reduction in **Employment Records** and a corresponding increase in **Median License Tenure**, as professional stints are viewed as continuous across parent organizations rather than fragmented across subsidiaries. 
+        The differences between these results and the research table are primarily due to the **Corporate Group Consolidation** preprocessing and the extended observation window. By grouping entities into companies (e.g., merging "Get Nice Securities" and "Get Nice Futures") by the first word of their name that is not a generic leading word such as "Hong Kong" or "China", unless `public/company_overrides.csv` maps them elsewhere, internal transfers within the same financial group are no longer counted as new employment records or exits. This leads to a significant reduction in **Employment Records** and a corresponding increase in **Median License Tenure**, as professional stints are viewed as continuous across parent organizations rather than fragmented across subsidiaries. 
 
         Furthermore, while the original research statistics covered the period from **2003–2024**, this updated analysis incorporates data up to **2026**, accounting for the higher count of **Total Professionals** ({int(stats["total_professionals"]):,}) and capturing more recent market volatility in the turnover metrics.
         """
@@ -501,6 +1106,125 @@ def _(mo, pl, sfc_professional_company_employment_history):
     return
 
 
+@app.cell
+def _(frame_fingerprint, np, pd, pl, sfc_professional_company_employment_history):
+    def decode_months(codes):
+        """
+        Month indexes, counted in months since Jan 1970, back to month starts.
+        """
+        return pd.to_datetime(
+            np.asarray(codes, dtype=np.int64).astype("datetime64[M]")
+        )
+
+
+    def encode_sfc_ids(df, columns=("companyId", "professionalId"), lookups=None):
+        """
+        Dictionary-encodes the string id columns of `df` as dense int32 codes.
+
+        Returns the encoded frame and the lookup tables, one pd.Index per
+        column, where code i stands for lookups[column][i]. Missing ids are
+        coded -1. Passing the `lookups` of an earlier run keeps its codes
+        stable and appends codes for the ids it has not seen.
+        """
+        lookups = dict(lookups or {})
+        codes = {}
+        for column in columns:
+            if column in lookups:
+                _known = lookups[column]
+                _new = pd.Index(df[column].dropna().unique()).difference(
+                    _known, sort=False
+                )
+                lookups[column] = _known.append(_new)
+                codes[column] = lookups[column].get_indexer(df[column])
+            else:
+                codes[column], lookups[column] = pd.factorize(df[column])
+            codes[column] = codes[column].astype(np.int32)
+        return df.assign(**codes), lookups
+
+
+    def decode_sfc_ids(df, lookups):
+        """
+        Decodes the id and month columns of an encoded table, for display only.
+        """
+        decoded = {}
+        for column, lookup in lookups.items():
+            if column in df:
+                codes = df[column].to_numpy()
+                decoded[column] = np.where(
+                    codes >= 0, lookup.to_numpy()[np.maximum(codes, 0)], None
+                )
+        if "snapshot_month" in df:
+            decoded["snapshot_month"] = decode_months(df["snapshot_month"])
+        return df.assign(**decoded)
+
+
+    def memory_report(tables, lookups):
+        """
+        Compares the memory of each encoded table with its decoded form.
+
+        The decoded size is worked out from the lookup tables rather than by
+        decoding: each id costs its UTF-8 length plus an 8-byte offset per
+        row, as a pandas string column does, and each month 8 bytes.
+        """
+        id_bytes = {
+            column: lookup.to_series().str.len().to_numpy() + 8
+            for column, lookup in lookups.items()
+        }
+        rows = []
+        for name, df in tables.items():
+            encoded_bytes = int(df.memory_usage(deep=True, index=False).sum())
+            decoded_bytes = encoded_bytes
+            for column, per_row in id_bytes.items():
+                if column in df:
+                    codes = df[column].to_numpy()
+                    decoded_bytes += int(per_row[codes[codes >= 0]].sum())
+                    decoded_bytes -= codes.nbytes
+            if "snapshot_month" in df:
+                decoded_bytes += len(df) * 8 - df["snapshot_month"].to_numpy().nbytes
+            rows.append(
+                {
+                    "table": name,
+                    "rows": len(df),
+                    "decoded_mb": decoded_bytes / 1e6,
+                    "encoded_mb": encoded_bytes / 1e6,
+                    "saving_pct": 100 * (1 - encoded_bytes / max(decoded_bytes, 1)),
+                }
+            )
+        return pd.DataFrame(rows)
+
+
+    if isinstance(sfc_professional_company_employment_history, pl.DataFrame):
+        _sfc_professional_company_employment_history = (
+            sfc_professional_company_employment_history.to_pandas()
+        )
+    else:
+        _sfc_professional_company_employment_history = (
+            sfc_professional_company_employment_history
+        )
+
+    # The heavy stages below run on the codes; sfc_id_lookups decodes them
+    encoded_sfc_professional_company_employment_history, sfc_id_lookups = (
+        encode_sfc_ids(
+            _sfc_professional_company_employment_history[
+                ["companyId", "professionalId", "effectiveDate", "endDate"]
+            ]
+        )
+    )
+    # Keys the cached results of the stages below
+    sfc_history_fingerprint = frame_fingerprint(
+        encoded_sfc_professional_company_employment_history
+    )
+    return (
+        decode_months,
+        decode_sfc_ids,
+        encode_sfc_ids,
+        encoded_sfc_professional_company_employment_history,
+        memory_report,
+        sfc_history_fingerprint,
+        sfc_id_lookups,
+    )
+
+
 @app.cell(hide_code=True)
 def _(mo):
     mo.md(r"""
@@ -546,6 +1270,7 @@ def _(mo):
     ## Set range for Monthly Snapshot
 
     - To prevent memory overflow, the default range is set to {default_min_year} to {default_max_year}
+    - Snapshots and features of a year range or window set computed before are loaded from a disk cache (`__marimo__/cache`) instead of being recomputed
 
 
             """
@@ -557,110 +1282,196 @@ def _(mo):
 
 
 @app.cell
-def _(
-    deepcopy,
-    pd,
-    pl,
-    sfc_professional_company_employment_history,
-    year_slider_for_snapshot,
-):
-    import datetime
+def _(np, pd):
+    def stint_month_range(df):
+        """
+        The first and last month start every stint of `df` is active in, as
+        datetime64[M]: a stint is active in month m when
+        effectiveDate <= m < endDate. Stints without an effectiveDate are NaT.
+        """
+        effective_date = pd.to_datetime(df["effectiveDate"]).to_numpy(
+            dtype="datetime64[D]"
+        )
+        # Fill empty end dates with a future date to represent current employees
+        end_day = (
+            pd.to_datetime(df["endDate"])
+            .fillna(pd.Timestamp("9999-01-01"))
+            .to_numpy(dtype="datetime64[D]")
+        )
+
+        # First month start on or after effectiveDate
+        first_month = effective_date.astype("datetime64[M]")
+        first_month = first_month + (
+            effective_date > first_month.astype("datetime64[D]")
+        )
+        # Last month start strictly before endDate
+        last_month = end_day.astype("datetime64[M]")
+        last_month = last_month - (end_day == last_month.astype("datetime64[D]"))
+        last_month[np.isnat(effective_date)] = np.datetime64("NaT")
+        return first_month, last_month
 
 
     def generate_monthly_active_sfc_professional_snapshot(
-        df, from_year=2003, to_year=2026
+        df, from_year=2003, to_year=2026, with_tenure=False
     ):
-        df = deepcopy(df)
-        df["effectiveDate"] = pd.to_datetime(df["effectiveDate"])
-        # Fill empty end dates with a future date to represent current employees
-        df["endDate"] = pd.to_datetime(df["endDate"]).fillna(
-            pd.Timestamp("9999-01-01")
-        )
+        """
+        Expands every employment stint into one row per month it is active in,
+        for the month starts from Jan `from_year` to Jan `to_year` inclusive.
+
+        A stint is active in month m when effectiveDate <= m < endDate, so it
+        covers a contiguous run of months. The snapshot is therefore built in
+        one pass with np.repeat over the stints, instead of filtering and
+        copying the whole table once per month.
+
+        `snapshot_month` is an int16 month index (months since Jan 1970), and
+        `companyId` / `professionalId` are carried over as they are in `df`,
+        i.e. as int32 codes for the encoded history. With `with_tenure`, the
+        months since the stint started are added as `tenure_months`.
+        """
+        first_month, last_month = stint_month_range(df)
+        end_date = pd.to_datetime(df["endDate"]).fillna(pd.Timestamp("9999-01-01"))
 
         # 2. Create Monthly Snapshots (The "Attendance Sheet")
         # We create a record for every person for every month they were active
-        start_date = datetime.date(year=from_year, month=1, day=1)
-        end_date = datetime.date(year=to_year, month=1, day=1)
-        months = pd.date_range(start_date, end_date, freq="MS")
-
-        snapshot_list = []
-        for m in months:
-            # Everyone active in month 'm'
-            active = deepcopy(df[(df["effectiveDate"] <= m) & (df["endDate"] > m)])
-            active["snapshot_month"] = m
-            snapshot_list.append(
-                active[
-                    ["snapshot_month", "companyId", "professionalId", "endDate"]
-                ]
-            )
-
-        monthly_active_sfc_professional_snapshot = pd.concat(
-            snapshot_list, ignore_index=True
+        start_month = first_month
+        first_month = np.maximum(first_month, np.datetime64(f"{from_year}-01", "M"))
+        last_month = np.minimum(last_month, np.datetime64(f"{to_year}-01", "M"))
+        months_active = (last_month - first_month).astype(np.int64) + 1
+        months_active[np.isnat(first_month) | (months_active < 0)] = 0
+
+        stint = np.repeat(np.arange(len(df)), months_active)
+        offset = np.arange(len(stint)) - np.repeat(
+            np.cumsum(months_active) - months_active, months_active
         )
+        snapshot_month = np.repeat(first_month, months_active) + offset
+
+        # Month by month, keeping the stints' order within a month
+        order = np.argsort(snapshot_month, kind="stable")
+        stint = stint[order]
+
+        monthly_active_sfc_professional_snapshot = pd.DataFrame(
+            {
+                "snapshot_month": snapshot_month[order].astype(np.int64).astype(
+                    np.int16
+                ),
+                "companyId": df["companyId"].to_numpy()[stint],
+                "professionalId": df["professionalId"].to_numpy()[stint],
+                "endDate": end_date.to_numpy()[stint],
+            }
+        )
+        if with_tenure:
+            monthly_active_sfc_professional_snapshot["tenure_months"] = (
+                (snapshot_month[order] - start_month[stint]).astype(np.int64).astype(np.int16)
+            )
 
         return monthly_active_sfc_professional_snapshot
+    return generate_monthly_active_sfc_professional_snapshot, stint_month_range
 
 
-    if isinstance(sfc_professional_company_employment_history, pl.DataFrame):
-        _sfc_professional_company_employment_history = (
-            sfc_professional_company_employment_history.to_pandas()
-        )
-    else:
-        _sfc_professional_company_employment_history = (
-            sfc_professional_company_employment_history
-        )
-
+@app.cell
+def _(
+    OUT_OF_CORE,
+    cached_frame,
+    code_fingerprint,
+    encoded_sfc_professional_company_employment_history,
+    generate_monthly_active_sfc_professional_snapshot,
+    mo,
+    sfc_history_fingerprint,
+    stint_month_range,
+    year_slider_for_snapshot,
+):
+    mo.stop(OUT_OF_CORE, mo.md("Skipped in the batch scripts"))
 
-    monthly_active_sfc_professional_snapshot = (
-        generate_monthly_active_sfc_professional_snapshot(
-            _sfc_professional_company_employment_history,
+    # Revisiting a year range loads its snapshot from the cell cache
+    monthly_active_sfc_professional_snapshot_key = {
+        "history": sfc_history_fingerprint,
+        "snapshot_code": code_fingerprint(
+            stint_month_range, generate_monthly_active_sfc_professional_snapshot
+        ),
+        "from_year": year_slider_for_snapshot.value[0],
+        "to_year": year_slider_for_snapshot.value[1],
+    }
+    monthly_active_sfc_professional_snapshot = cached_frame(
+        "monthly_active_sfc_professional_snapshot",
+        monthly_active_sfc_professional_snapshot_key,
+        lambda: generate_monthly_active_sfc_professional_snapshot(
+            encoded_sfc_professional_company_employment_history,
             from_year=year_slider_for_snapshot.value[0],
             to_year=year_slider_for_snapshot.value[1],
-        )
+        ),
     )
-    return (monthly_active_sfc_professional_snapshot,)
-
-
-@app.cell(hide_code=True)
-def _(alt, mo, monthly_active_sfc_professional_snapshot):
-    active_sfc_professional_by_month = mo.sql(
-        f"""
-        select
-            snapshot_month,
-            count(*) as active_sfc_professional
-        from
-            monthly_active_sfc_professional_snapshot
-        group by
-            1
-        """
+    return (
+        monthly_active_sfc_professional_snapshot,
+        monthly_active_sfc_professional_snapshot_key,
     )
 
 
-    # Create the bar _chart
-    _chart = (
-        alt.Chart(active_sfc_professional_by_month)
-        .mark_bar()
-        .encode(
-            x=alt.X("snapshot_month:T", title="Snapshot Month"),
-            y=alt.Y("active_sfc_professional:Q", title="Active SFC Professionals"),
-            tooltip=[
-                alt.Tooltip("snapshot_month:T", title="Month"),
-                alt.Tooltip("active_sfc_professional:Q", title="Count"),
-            ],
-        )
-        .properties(
-            title="Active SFC Professionals by Month", width=800, height=400
+@app.cell
+def precompute_monthly_active_sfc_professionals(
+    decode_months,
+    encoded_sfc_professional_company_employment_history,
+    generate_monthly_active_sfc_professional_snapshot,
+    is_precomputing,
+    mo,
+):
+    # Computed by scripts/build.py --precompute only; the chart below reads
+    # the stored artifact
+    mo.stop(not is_precomputing)
+
+    monthly_active_sfc_professionals_2003_to_2026 = (
+        generate_monthly_active_sfc_professional_snapshot(
+            encoded_sfc_professional_company_employment_history,
+            from_year=2003,
+            to_year=2026,
         )
-        .interactive()
+        .groupby("snapshot_month")
+        .size()
+        .reset_index(name="active_sfc_professional")
     )
+    monthly_active_sfc_professionals_2003_to_2026["snapshot_month"] = (
+        decode_months(monthly_active_sfc_professionals_2003_to_2026["snapshot_month"])
+    )
+    return (monthly_active_sfc_professionals_2003_to_2026,)
 
-    with open(mo.notebook_location() / "public" / "monthly_active_sfc_professionals_from_2003_to_2026.json", "r") as _file:
-        _chart_jsonspec = _file.read()
-    _monthly_active_sfc_professionals_from_2003_to_2026 = alt.Chart.from_json(_chart_jsonspec)
-    monthly_active_sfc_professionals_from_2003_to_2026 = mo.ui.altair_chart(_monthly_active_sfc_professionals_from_2003_to_2026)
 
+@app.cell
+def _(alt):
+    def active_sfc_professional_chart(df):
+        # Create the bar _chart
+        return (
+            alt.Chart(df)
+            .mark_bar()
+            .encode(
+                x=alt.X("snapshot_month:T", title="Snapshot Month"),
+                y=alt.Y("active_sfc_professional:Q", title="Active SFC Professionals"),
+                tooltip=[
+                    alt.Tooltip("snapshot_month:T", title="Month"),
+                    alt.Tooltip("active_sfc_professional:Q", title="Count"),
+                ],
+            )
+            .properties(
+                title="Active SFC Professionals by Month", width=800, height=400
+            )
+            .interactive()
+        )
+    return (active_sfc_professional_chart,)
 
 
+@app.cell(hide_code=True)
+def _(active_sfc_professional_chart, alt, load_precomputed, mo):
+    # Only precomputed inputs, so that the published notebook shows the chart
+    # without loading the register
+    _monthly_active = load_precomputed("monthly_active_sfc_professionals_2003_to_2026")
+    if _monthly_active is not None:
+        _monthly_active_sfc_professionals_from_2003_to_2026 = active_sfc_professional_chart(
+            _monthly_active
+        )
+    else:
+        with open(mo.notebook_location() / "public" / "monthly_active_sfc_professionals_from_2003_to_2026.json", "r") as _file:
+            _chart_jsonspec = _file.read()
+        _monthly_active_sfc_professionals_from_2003_to_2026 = alt.Chart.from_json(_chart_jsonspec)
+    monthly_active_sfc_professionals_from_2003_to_2026 = mo.ui.altair_chart(_monthly_active_sfc_professionals_from_2003_to_2026)
+
     mo.vstack(
         [
             mo.md(
@@ -672,13 +1483,36 @@ def _(alt, mo, monthly_active_sfc_professional_snapshot):
             However, the _chart also validates the impact of external stressors on market momentum. The stagnation observed around 2009 and the more recent plateau starting in 2020 directly mirror the periods where license issuance and termination reached parity. Following the 2020 peak, the slight decline in the total count of active professionals through 2026 suggests a more sustained period of industry contraction or consolidation, where the balance has shifted toward terminations. This recent trend emphasizes how global events can transition the market from a state of steady growth into a phase of significant labor market stress and stagnation.
             """
             ),
-            _chart,
+            monthly_active_sfc_professionals_from_2003_to_2026,
+        ]
+    )
+    return
+
+
+@app.cell(hide_code=True)
+def _(active_sfc_professional_chart, mo, turnover_aggregate_cube):
+    active_sfc_professional_by_month = mo.sql(
+        f"""
+        select
+            -- snapshot_month is a month index; decode it to the month start
+            timestamp '1970-01-01' + to_months(snapshot_month) as snapshot_month,
+            sum(headcount)::bigint as active_sfc_professional
+        from
+            turnover_aggregate_cube
+        group by
+            1
+        """
+    )
+
+
+    mo.vstack(
+        [
             mo.md(
                 """
-            This is how you would see if you set the range from 2003 to 2026
+            This is the same chart for the year range selected above
             """,
             ),
-            monthly_active_sfc_professionals_from_2003_to_2026,
+            active_sfc_professional_chart(active_sfc_professional_by_month),
         ]
     )
     return
@@ -725,7 +1559,7 @@ def _(mo):
     # Result: Impact of Peer Departures on Individual Turnover Probability
 
 
-    #### Warning: Due to memory limitation, choose at most 3 windows
+    All windows are computed in one pass, one column per window, so any number of them can be selected.
 
             """
             ),
@@ -735,138 +1569,567 @@ def _(mo):
     return (lookback_selection,)
 
 
+@app.function
+def count_peer_departures(month, company, professional, lookback_months_list):
+    """
+    Counts peer departures for every company, month and lookback window.
+
+    `month`, `company` and `professional` are the integer codes of the
+    snapshot rows. For each window x, the staff of a company x months before a month
+    are looked up in that month by their (company, professional, month) key
+    in one sorted array. The counts are then accumulated into dense
+    company x month arrays, so no per-window merge or copy of the snapshot
+    is needed.
+
+    Returns the first month code and, per window, the (departed_count,
+    total_past_cohort_size) arrays indexed by [company, month - first month].
+    """
+    import numpy as np
+
+    first_month = month.min()
+    n_months = int(month.max() - first_month) + 1
+    n_companies = int(company.max()) + 1
+    n_professionals = int(professional.max()) + 1
+    # Leave room past the last month so that shifted keys never spill over
+    span = n_months + max(lookback_months_list)
+
+    key = (
+        company.astype(np.int64) * n_professionals + professional
+    ) * span + (month - first_month)
+    present, multiplicity = np.unique(key, return_counts=True)
+    company_month = (present // (n_professionals * span)) * span + present % span
+    headcount = np.bincount(
+        company_month, minlength=n_companies * span
+    ).reshape(n_companies, span)
+
+    counts = {}
+    for x in lookback_months_list:
+        position = np.searchsorted(present, present + x)
+        position[position == len(present)] = 0
+        still_present = present[position] == present + x
+
+        retained = np.bincount(
+            company_month + x,
+            weights=still_present,
+            minlength=n_companies * span,
+        ).reshape(n_companies, span)
+        # A past member still present counts once per matching snapshot row,
+        # as it did with the row-level merge
+        retained_rows = np.bincount(
+            company_month + x,
+            weights=np.where(still_present, multiplicity[position], 0),
+            minlength=n_companies * span,
+        ).reshape(n_companies, span)
+
+        past_cohort = np.zeros_like(headcount)
+        past_cohort[:, x:] = headcount[:, : span - x]
+
+        departed_count = (past_cohort - retained)[:, :n_months]
+        total_past_cohort_size = (past_cohort - retained + retained_rows)[:, :n_months]
+        counts[x] = (departed_count, total_past_cohort_size)
+
+    return first_month, counts
+
+
+@app.function
+def count_peer_departures_shard(shard, month, company, professional):
+    """
+    count_peer_departures for the windows of `shard` and its months
+    `first` to `last`, from the rows of those months and the halo of
+    months its windows reach back to; `month` is sorted.
+
+    Returns the first month and (departed_count, total_past_cohort_size)
+    arrays of the shard's months, or None without rows.
+    """
+    import numpy as np
+
+    windows, first, last = shard
+    start, start_in_months, stop = np.searchsorted(
+        month, [first - max(windows), first, last + 1]
+    )
+    if start_in_months == stop:
+        return None
+
+    sub_first, counts = count_peer_departures(
+        month[start:stop], company[start:stop], professional[start:stop], windows
+    )
+    shard_first = max(first, sub_first)
+    columns = slice(shard_first - sub_first, last - sub_first + 1)
+    return shard_first, {
+        x: (departed_count[:, columns], total_past_cohort_size[:, columns])
+        for x, (departed_count, total_past_cohort_size) in counts.items()
+    }
+
+
+@app.function
+def count_peer_departure_shards(shards, month, company, professional):
+    """count_peer_departures_shard of each of `shards`, in a worker process."""
+    return [
+        count_peer_departures_shard(shard, month, company, professional)
+        for shard in shards
+    ]
+
+
 @app.cell
-def _(
-    deepcopy,
-    lookback_selection,
-    monthly_active_sfc_professional_snapshot,
-    pd,
-):
+def _(mo, np, os, pd):
+    import multiprocessing
+    import pickle
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+
+    # Processes counting peer departures; -1 uses every core
+    FEATURE_N_JOBS = int(mo.cli_args().get("n-jobs", 1))
+    # Worker pools by size, kept for the session, as a spawned worker starts
+    # by importing the notebook
+    _shard_pools = {}
+
+
     def add_left_next_momth(monthly_active_sfc_professional_snapshot):
         # add `left_next_month` to indicate if the professional will leave within the coming month
+        _month_start = (
+            monthly_active_sfc_professional_snapshot["snapshot_month"]
+            .to_numpy()
+            .astype("datetime64[M]")
+        )
+        _end_date = monthly_active_sfc_professional_snapshot["endDate"].to_numpy()
         monthly_active_sfc_professional_snapshot["left_next_month"] = (
-            (
-                monthly_active_sfc_professional_snapshot["endDate"]
-                > monthly_active_sfc_professional_snapshot["snapshot_month"]
-            )
-            & (
-                monthly_active_sfc_professional_snapshot["endDate"]
-                <= (
-                    monthly_active_sfc_professional_snapshot["snapshot_month"]
-                    + pd.DateOffset(months=1)
-                )
-            )
-        ).astype(int)
+            (_end_date > _month_start)
+            & (_end_date <= _month_start + np.timedelta64(1, "M"))
+        ).astype(np.int8)
 
         return monthly_active_sfc_professional_snapshot
 
 
-    def create_multi_lookback_features(df, lookback_months_list):
+    def count_peer_departures_parallel(
+        month, company, professional, lookback_months_list, n_jobs=-1, partition_months=60
+    ):
         """
-        Creates a long-form dataframe containing peer departure percentages
-        for multiple lookback windows.
-
+        count_peer_departures, sharded over `n_jobs` worker processes (all
+        cores with -1).
+
+        The months are split into partitions of `partition_months`. When
+        there are fewer partitions than processes, the windows are split
+        into groups too. Each shard reads its rows plus a halo of the months
+        its windows reach back to. It returns the counts of its own months
+        only, which are copied into place, so the result does not depend on
+        the order the shards finish in.
+
+        Workers are spawned, not forked, as forking the notebook's threaded
+        kernel can deadlock; each receives one pickled copy of the codes for
+        all its shards, and imports the shard functions from the notebook,
+        where they are top-level functions. The workers are kept for later
+        calls. Where processes cannot be started, e.g. in the browser, or
+        the shard functions cannot be pickled, the pool is shut down and the
+        shards run one after the other.
         """
-        df["snapshot_month"] = pd.to_datetime(df["snapshot_month"])
-        all_results = []
-
-        # 1. Identify the unique people at each company per month
-        historical_cohorts = df[
-            ["snapshot_month", "companyId", "professionalId"]
-        ].drop_duplicates()
-
-        for x in lookback_months_list:
-            # Create a reference for the cohort from 'x' months ago
-            cohort_shifted = deepcopy(historical_cohorts)
-            cohort_shifted["comparison_month"] = cohort_shifted[
-                "snapshot_month"
-            ] + pd.DateOffset(months=x)
-
-            # 2. Match the past cohort to the current state (Today)
-            presence_check = pd.merge(
-                cohort_shifted,
-                df[["snapshot_month", "companyId", "professionalId"]],
-                left_on=["comparison_month", "companyId", "professionalId"],
-                right_on=["snapshot_month", "companyId", "professionalId"],
-                how="left",
-                indicator=True,
-            )
-
-            # If 'left_only', that specific person from the past is gone today
-            presence_check["is_departed"] = (
-                presence_check["_merge"] == "left_only"
-            ).astype(int)
-
-            # 3. Aggregate to Company-Level Percentage
-            departure_stats = (
-                presence_check.groupby(["comparison_month", "companyId"])
-                .agg(
-                    departed_count=("is_departed", "sum"),
-                    total_past_cohort_size=("is_departed", "count"),
+        n_jobs = os.cpu_count() if n_jobs in (None, -1) else n_jobs
+        order = np.argsort(month, kind="stable")
+        codes = (month[order], company[order], professional[order])
+
+        first_month = int(month.min())
+        last_month = int(month.max())
+        n_months = last_month - first_month + 1
+        n_companies = int(company.max()) + 1
+        partitions = [
+            (first, min(first + partition_months - 1, last_month))
+            for first in range(first_month, last_month + 1, partition_months)
+        ]
+        n_groups = max(1, min(len(lookback_months_list), n_jobs // len(partitions)))
+        groups = [lookback_months_list[i::n_groups] for i in range(n_groups)]
+        shards = [(windows, first, last) for windows in groups for first, last in partitions]
+
+        n_workers = min(n_jobs, len(shards))
+        results = None
+        if n_workers > 1:
+            worker_shards = [shards[i::n_workers] for i in range(n_workers)]
+            try:
+                if n_workers not in _shard_pools:
+                    _shard_pools[n_workers] = ProcessPoolExecutor(
+                        n_workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                results = list(
+                    _shard_pools[n_workers].map(
+                        count_peer_departure_shards,
+                        worker_shards,
+                        *([code] * n_workers for code in codes),
+                    )
                 )
-                .reset_index()
+                # Back in shard order
+                results = [
+                    results[i % n_workers][i // n_workers] for i in range(len(shards))
+                ]
+            except (
+                NotImplementedError,
+                OSError,
+                BrokenProcessPool,
+                pickle.PicklingError,
+            ):
+                pool = _shard_pools.pop(n_workers, None)
+                if pool is not None:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                results = None
+        if results is None:
+            results = [count_peer_departures_shard(shard, *codes) for shard in shards]
+
+        counts = {
+            x: (
+                np.zeros((n_companies, n_months)),
+                np.zeros((n_companies, n_months)),
+            )
+            for x in lookback_months_list
+        }
+        for result in results:
+            if result is None:
+                continue
+            shard_first, shard_counts = result
+            offset = shard_first - first_month
+            for x, (departed_count, total_past_cohort_size) in shard_counts.items():
+                rows, columns = departed_count.shape
+                counts[x][0][:rows, offset : offset + columns] = departed_count
+                counts[x][1][:rows, offset : offset + columns] = total_past_cohort_size
+        return first_month, counts
+
+
+    def departure_pct(departed_count, total_past_cohort_size):
+        """Percentage of the past cohort that departed, NaN without a cohort."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(
+                total_past_cohort_size > 0,
+                departed_count / total_past_cohort_size * 100,
+                np.nan,
             )
 
-            feature_name = "pct_departed_staff"
-            departure_stats[feature_name] = (
-                departure_stats["departed_count"]
-                / departure_stats["total_past_cohort_size"]
-            ) * 100
 
-            # 4. Merge back to individual records for this specific 'x'
-            temp_df = pd.merge(
-                df,
-                departure_stats[["comparison_month", "companyId", feature_name]],
-                left_on=["snapshot_month", "companyId"],
-                right_on=["comparison_month", "companyId"],
-                how="left",
-            ).drop(columns=["comparison_month"])
+    def create_multi_lookback_features(df, lookback_months_list, long=False, n_jobs=1):
+        """
+        Adds the peer departure percentage of every lookback window to the
+        snapshot, as one `pct_departed_staff_<x>m` column per window. Rows
+        without enough history for a window are NaN in that column.
+
+        With `long=True`, returns the long-form view instead: one copy of the
+        rows with history per window, with `pct_departed_staff` and
+        `lookback_period` columns for facetting.
 
-            # Add metadata for facetting
-            temp_df["lookback_period"] = f"{x} Months"
+        With `n_jobs` other than 1, the peer departures are counted by
+        count_peer_departures_parallel.
+        """
+        lookback_months_list = list(lookback_months_list)
+
+        # 1. The encoded snapshot already identifies people, companies and
+        # months by integer codes; -1 is a missing id. A missing company has
+        # no peers, while a missing professional is matched like any other id
+        month = df["snapshot_month"].to_numpy(dtype=np.int64)
+        company = df["companyId"].to_numpy(dtype=np.int64)
+        professional = df["professionalId"].to_numpy(dtype=np.int64) + 1
+        has_company = company >= 0
+
+        pct_departed_staff = {}
+        if has_company.any() and lookback_months_list:
+            # 2. Match every past cohort to the current state in one pass
+            codes = (
+                month[has_company],
+                company[has_company],
+                professional[has_company],
+                lookback_months_list,
+            )
+            if n_jobs == 1:
+                first_month, counts = count_peer_departures(*codes)
+            else:
+                first_month, counts = count_peer_departures_parallel(
+                    *codes, n_jobs=n_jobs
+                )
+            for x, (departed_count, total_past_cohort_size) in counts.items():
+                # 3. Company-level percentage, broadcast back to the rows
+                pct = departure_pct(departed_count, total_past_cohort_size)
+                month_offset = np.clip(month - first_month, 0, pct.shape[1] - 1)
+                values = pct[np.where(has_company, company, 0), month_offset]
+                values[~has_company] = np.nan
+                pct_departed_staff[x] = values
+        else:
+            pct_departed_staff = {x: np.full(len(df), np.nan) for x in lookback_months_list}
+
+        if not long:
+            return df.assign(
+                **{
+                    f"pct_departed_staff_{x}m": values.astype(np.float32)
+                    for x, values in pct_departed_staff.items()
+                }
+            )
 
+        all_results = []
+        for x, values in pct_departed_staff.items():
             # Drop rows where we don't have enough history for this specific window
-            temp_df = temp_df.dropna(subset=[feature_name])
-
+            has_history = ~np.isnan(values)
+            temp_df = df[has_history].assign(
+                pct_departed_staff=values[has_history],
+                # Add metadata for facetting
+                lookback_period=f"{x} Months",
+            )
             all_results.append(temp_df)
 
         # Combine all lookbacks into one long-form dataframe
         return pd.concat(all_results, ignore_index=True)
+    return (
+        FEATURE_N_JOBS,
+        add_left_next_momth,
+        count_peer_departures_parallel,
+        create_multi_lookback_features,
+        departure_pct,
+    )
+
 
+@app.cell
+def _(
+    FEATURE_N_JOBS,
+    OUT_OF_CORE,
+    add_left_next_momth,
+    cached_frame,
+    code_fingerprint,
+    count_peer_departure_shards,
+    count_peer_departures,
+    count_peer_departures_parallel,
+    count_peer_departures_shard,
+    create_multi_lookback_features,
+    decode_sfc_ids,
+    departure_pct,
+    lookback_selection,
+    mo,
+    monthly_active_sfc_professional_snapshot,
+    monthly_active_sfc_professional_snapshot_key,
+    sfc_id_lookups,
+):
+    mo.stop(OUT_OF_CORE, mo.md("Skipped in the batch scripts"))
 
     selected_months = [int(m) for m in lookback_selection.value]
 
     selected_months.sort()
 
-    monthly_active_sfc_professional_features_snapshot = add_left_next_momth(
-        monthly_active_sfc_professional_snapshot
-    )
-    monthly_active_sfc_professional_features_snapshot = (
-        create_multi_lookback_features(
-            monthly_active_sfc_professional_snapshot,
+    # Keyed on the snapshot's own key, so a revisited year range and window
+    # set is loaded without computing the snapshot's features again
+    monthly_active_sfc_professional_features_snapshot_key = {
+        **monthly_active_sfc_professional_snapshot_key,
+        "features_code": code_fingerprint(
+            add_left_next_momth,
+            count_peer_departures,
+            count_peer_departures_shard,
+            count_peer_departure_shards,
+            count_peer_departures_parallel,
+            departure_pct,
+            create_multi_lookback_features,
+        ),
+        "lookback_months": selected_months,
+    }
+    monthly_active_sfc_professional_features_snapshot = cached_frame(
+        "monthly_active_sfc_professional_features_snapshot",
+        monthly_active_sfc_professional_features_snapshot_key,
+        lambda: create_multi_lookback_features(
+            add_left_next_momth(monthly_active_sfc_professional_snapshot),
             lookback_months_list=selected_months,
+            n_jobs=FEATURE_N_JOBS,
+        ),
+    )
+
+    # Decode only the rows on display; the table itself stays encoded
+    decode_sfc_ids(
+        monthly_active_sfc_professional_features_snapshot.head(1_000), sfc_id_lookups
+    )
+    return (
+        monthly_active_sfc_professional_features_snapshot,
+        monthly_active_sfc_professional_features_snapshot_key,
+        selected_months,
+    )
+
+
+@app.cell(hide_code=True)
+def _(
+    OUT_OF_CORE,
+    encoded_sfc_professional_company_employment_history,
+    memory_report,
+    mo,
+    monthly_active_sfc_professional_features_snapshot,
+    monthly_active_sfc_professional_snapshot,
+    sfc_id_lookups,
+    turnover_aggregate_cube,
+):
+    mo.stop(OUT_OF_CORE)
+
+    mo.vstack(
+        [
+            mo.md(
+                """
+            ### Memory of the Encoded Tables
+            Professionals and companies are stored as int32 codes and months as int16 month indexes; the strings and dates are only looked up for display. The charts query the aggregate cube, one row per company and month, rather than the snapshots.
+            """
+            ),
+            mo.ui.table(
+                memory_report(
+                    {
+                        "employment_history": encoded_sfc_professional_company_employment_history,
+                        "monthly_snapshot": monthly_active_sfc_professional_snapshot,
+                        "features_snapshot": monthly_active_sfc_professional_features_snapshot,
+                        "aggregate_cube": turnover_aggregate_cube,
+                    },
+                    sfc_id_lookups,
+                ).round(2)
+            ),
+        ]
+    )
+    return
+
+
+@app.cell
+def _(
+    OUT_OF_CORE,
+    cached_frame,
+    code_fingerprint,
+    encoded_sfc_professional_company_employment_history,
+    mo,
+    monthly_active_sfc_professional_features_snapshot,
+    monthly_active_sfc_professional_features_snapshot_key,
+    np,
+    pd,
+    selected_months,
+    stint_month_range,
+):
+    mo.stop(OUT_OF_CORE, mo.md("Skipped in the batch scripts"))
+
+
+    def build_turnover_aggregate_cube(features_snapshot, stints, lookback_months_list):
+        """
+        Aggregates the features snapshot to one row per company and month:
+        the headcount, the joiners (stints whose first active month it is),
+        the departures (staff leaving within the next month), their rate and
+        the company's `pct_departed_staff_<x>m` for every lookback window.
+
+        The dashboards query this cube instead of the snapshot rows. Means
+        over snapshot rows are headcount-weighted means over the cube.
+        """
+        pct_columns = [f"pct_departed_staff_{x}m" for x in lookback_months_list]
+        cube = (
+            features_snapshot.groupby(["companyId", "snapshot_month"], sort=True)
+            .agg(
+                headcount=("left_next_month", "size"),
+                departures=("left_next_month", "sum"),
+                # Company-level already, so every row of the group agrees
+                **{column: (column, "first") for column in pct_columns},
+            )
+            .reset_index()
         )
+
+        first_month, _ = stint_month_range(stints)
+        has_start = ~np.isnat(first_month)
+        joiners = (
+            pd.DataFrame(
+                {
+                    "companyId": stints["companyId"].to_numpy()[has_start],
+                    "snapshot_month": first_month[has_start]
+                    .astype(np.int64)
+                    .astype(np.int16),
+                }
+            )
+            .value_counts()
+            .rename("joiners")
+        )
+        cube = cube.join(joiners, on=["companyId", "snapshot_month"])
+
+        return cube.assign(
+            headcount=cube["headcount"].astype(np.int32),
+            joiners=cube["joiners"].fillna(0).astype(np.int32),
+            departures=cube["departures"].astype(np.int32),
+            left_next_month_rate=cube["departures"] / cube["headcount"],
+        )[
+            [
+                "companyId",
+                "snapshot_month",
+                "headcount",
+                "joiners",
+                "departures",
+                "left_next_month_rate",
+                *pct_columns,
+            ]
+        ]
+
+
+    # Persisted beside the features it aggregates, under the same key
+    turnover_aggregate_cube = cached_frame(
+        "turnover_aggregate_cube",
+        {
+            **monthly_active_sfc_professional_features_snapshot_key,
+            "cube_code": code_fingerprint(build_turnover_aggregate_cube),
+        },
+        lambda: build_turnover_aggregate_cube(
+            monthly_active_sfc_professional_features_snapshot,
+            encoded_sfc_professional_company_employment_history,
+            selected_months,
+        ),
     )
+    return build_turnover_aggregate_cube, turnover_aggregate_cube
 
-    monthly_active_sfc_professional_features_snapshot
-    return (monthly_active_sfc_professional_features_snapshot,)
+
+@app.cell
+def precompute_turnover_correlation_metrics(
+    FEATURE_N_JOBS,
+    add_left_next_momth,
+    create_multi_lookback_features,
+    decode_months,
+    encoded_sfc_professional_company_employment_history,
+    generate_monthly_active_sfc_professional_snapshot,
+    import_script,
+    is_precomputing,
+    mo,
+):
+    import tempfile
+
+    # Computed by scripts/build.py --precompute only; the result chart at the
+    # top reads the stored artifact
+    mo.stop(not is_precomputing)
+
+    # Same aggregation as past_staff_departure_vs_next_month_departure_metrics,
+    # streamed a year at a time so the full range fits in memory
+    with tempfile.TemporaryDirectory() as _spill_dir:
+        turnover_correlation_metrics_2003_to_2026 = import_script(
+            "out_of_core_metrics"
+        ).stream_turnover_metrics(
+            {
+                "add_left_next_momth": add_left_next_momth,
+                "create_multi_lookback_features": create_multi_lookback_features,
+                "decode_months": decode_months,
+                "generate_monthly_active_sfc_professional_snapshot": (
+                    generate_monthly_active_sfc_professional_snapshot
+                ),
+            },
+            encoded_sfc_professional_company_employment_history,
+            _spill_dir,
+            lookback_months_list=[3, 6, 12],
+            from_year=2003,
+            to_year=2026,
+            n_jobs=FEATURE_N_JOBS,
+        )
+    return (turnover_correlation_metrics_2003_to_2026,)
 
 
 @app.cell(hide_code=True)
-def _(mo, monthly_active_sfc_professional_features_snapshot):
+def _(mo, turnover_aggregate_cube):
     past_staff_departure_vs_next_month_departure_metrics = mo.sql(
         f"""
+        -- One row per window, company and month; companies without enough
+        -- history for a window are NULL in its column and dropped by UNPIVOT.
+        WITH features_by_lookback_period AS (
+            UNPIVOT turnover_aggregate_cube
+            ON COLUMNS('^pct_departed_staff_')
+            INTO NAME lookback_column VALUE pct_departed_staff
+        )
         SELECT 
-            lookback_period,
-            snapshot_month,
-            -- companyId,
-            -- Since pct_departed_staff is already a company-level calculation, 
-            -- AVG will return the value itself for that group.
-            AVG(pct_departed_staff) AS pct_departed_staff,
+            regexp_extract(lookback_column, '(\\d+)m$', 1) || ' Months' AS lookback_period,
+            -- snapshot_month is a month index; decode it to the month start
+            TIMESTAMP '1970-01-01' + to_months(snapshot_month) AS snapshot_month,
+            -- The average over the staff of every company, each company's
+            -- percentage weighted by its headcount
+            SUM(pct_departed_staff::DOUBLE * headcount) / SUM(headcount) AS pct_departed_staff,
             -- This calculates the turnover probability (e.g., 0.05 for 5%)
-            AVG(left_next_month) AS avg_left_next_month
+            SUM(departures) / SUM(headcount) AS avg_left_next_month
         FROM 
-            monthly_active_sfc_professional_features_snapshot
+            features_by_lookback_period
         GROUP BY 
             lookback_period,
             snapshot_month
@@ -889,56 +2152,69 @@ def _(mo, monthly_active_sfc_professional_features_snapshot):
 
 
 @app.cell
-def _(alt, mo, past_staff_departure_vs_next_month_departure_metrics):
-    # Build the base chart
-    _base = alt.Chart(past_staff_departure_vs_next_month_departure_metrics).encode(
-        x=alt.X(
-            "pct_departed_staff:Q",
-            title="Peer Departure % (Past X Months)",
-            scale=alt.Scale(domain=[0, 30]),
-        ),
-        y=alt.Y(
-            "avg_left_next_month:Q",
-            title="Turnover Probability (%)",
-            # Format axis as percentage (e.g., 0.05 becomes 5%)
-            axis=alt.Axis(format='%'), 
-            scale=alt.Scale(domain=[0, 0.05]),
-        ),
-    )
+def _(alt):
+    def turnover_probability_chart(metrics):
+        # Build the base chart
+        _base = alt.Chart(metrics).encode(
+            x=alt.X(
+                "pct_departed_staff:Q",
+                title="Peer Departure % (Past X Months)",
+                scale=alt.Scale(domain=[0, 30]),
+            ),
+            y=alt.Y(
+                "avg_left_next_month:Q",
+                title="Turnover Probability (%)",
+                # Format axis as percentage (e.g., 0.05 becomes 5%)
+                axis=alt.Axis(format='%'), 
+                scale=alt.Scale(domain=[0, 0.05]),
+            ),
+        )
 
-    # Layer 1: Scatter points with updated tooltip format
-    _points = _base.mark_point(opacity=0.4, size=25, color="steelblue").encode(
-        tooltip=[
-            alt.Tooltip("lookback_period:N", title="Window"),
-            alt.Tooltip("pct_departed_staff:Q", title="Peer Departure %", format=".2f"),
-            # Format tooltip as percentage with 2 decimal places (e.g., 1.25%)
-            alt.Tooltip("avg_left_next_month:Q", title="Avg Prob. of Leaving", format=".2%")
-        ]
-    )
+        # Layer 1: Scatter points with updated tooltip format
+        _points = _base.mark_point(opacity=0.4, size=25, color="steelblue").encode(
+            tooltip=[
+                alt.Tooltip("lookback_period:N", title="Window"),
+                alt.Tooltip("pct_departed_staff:Q", title="Peer Departure %", format=".2f"),
+                # Format tooltip as percentage with 2 decimal places (e.g., 1.25%)
+                alt.Tooltip("avg_left_next_month:Q", title="Avg Prob. of Leaving", format=".2%")
+            ]
+        )
 
-    # Layer 2: Linear Regression line
-    _line = _base.transform_regression(
-        "pct_departed_staff", "avg_left_next_month"
-    ).mark_line(color="red", size=3)
+        # Layer 2: Linear Regression line
+        _line = _base.transform_regression(
+            "pct_departed_staff", "avg_left_next_month"
+        ).mark_line(color="red", size=3)
+
+
+        # Combine layers and facet
+        return (
+            (_points + _line)
+            .facet(
+                facet=alt.Facet(
+                    "lookback_period:N",
+                    title=None,
+                    sort=["3 Months", "6 Months", "12 Months"],
+                ),
+                columns=3,
+            )
+            .properties(
+                title="Impact of Peer Departures on Individual Turnover Probability"
+            )
+            .configure_axis(grid=True)
+            .configure_view(stroke=None)
+            .resolve_axis(x='independent') 
+        )
+    return (turnover_probability_chart,)
 
 
-    # Combine layers and facet
-    _chart = (
-        (_points + _line)
-        .facet(
-            facet=alt.Facet(
-                "lookback_period:N",
-                title=None,
-                sort=["3 Months", "6 Months", "12 Months"],
-            ),
-            columns=3,
-        )
-        .properties(
-            title="Impact of Peer Departures on Individual Turnover Probability"
-        )
-        .configure_axis(grid=True)
-        .configure_view(stroke=None)
-        .resolve_axis(x='independent') 
+@app.cell
+def _(
+    mo,
+    past_staff_departure_vs_next_month_departure_metrics,
+    turnover_probability_chart,
+):
+    _chart = turnover_probability_chart(
+        past_staff_departure_vs_next_month_departure_metrics
     )
 
     mo.vstack(
@@ -955,5 +2231,417 @@ def _(alt, mo, past_staff_departure_vs_next_month_departure_metrics):
     return
 
 
+@app.cell(hide_code=True)
+def _(mo):
+    mo.md(r"""
+    # Predicting Turnover
+
+    The paper goes one step further than the averages above: it predicts whether a professional leaves next month. This stage trains a logistic regression and a gradient boosting model on the peer departure percentages of the 3, 6 and 12-month windows, the professional's tenure in months and the company's headcount.
+
+    The feature matrix is built once per employment history, year range and window set, a year at a time, and memory-mapped from the cache directory, so the cross-validation workers share it instead of copying it. Each of the last years is scored on a model trained on all the months before it. The table reports the ROC AUC of every fold, with the fit time and the peak memory of the run.
+
+    Training takes a while on the full history, so it only runs on request, or with the script in the repository's `scripts/` folder, e.g. monthly:
+
+    ```
+    python scripts/turnover_models.py [--from-year 2003] [--to-year 2026] [--n-jobs -1]
+    ```
+    """)
+    return
+
+
+@app.cell
+def _(mo):
+    train_models_button = mo.ui.run_button(
+        label="Train turnover models on the selected year range"
+    )
+    train_models_button
+    return (train_models_button,)
+
+
+@app.cell
+def _(
+    FEATURE_N_JOBS,
+    NOTEBOOK_CACHE_DIR,
+    add_left_next_momth,
+    code_fingerprint,
+    create_multi_lookback_features,
+    encoded_sfc_professional_company_employment_history,
+    generate_monthly_active_sfc_professional_snapshot,
+    import_script,
+    mo,
+    sfc_history_fingerprint,
+    stint_month_range,
+    train_models_button,
+    year_slider_for_snapshot,
+):
+    mo.stop(not train_models_button.value)
+
+    _turnover_models = import_script("turnover_models")
+    _from_year, _to_year = year_slider_for_snapshot.value
+    _features, _labels, _months, _columns = (
+        _turnover_models.load_turnover_feature_matrix(
+            {
+                "add_left_next_momth": add_left_next_momth,
+                "code_fingerprint": code_fingerprint,
+                "create_multi_lookback_features": create_multi_lookback_features,
+                "generate_monthly_active_sfc_professional_snapshot": (
+                    generate_monthly_active_sfc_professional_snapshot
+                ),
+                "stint_month_range": stint_month_range,
+            },
+            encoded_sfc_professional_company_employment_history,
+            sfc_history_fingerprint,
+            from_year=_from_year,
+            to_year=_to_year,
+            n_jobs=FEATURE_N_JOBS,
+            cache_dir=NOTEBOOK_CACHE_DIR,
+        )
+    )
+    turnover_model_report = _turnover_models.train_turnover_models(
+        _features, _labels, _months, n_jobs=FEATURE_N_JOBS
+    )
+
+    mo.ui.table(turnover_model_report.round(3))
+    return (turnover_model_report,)
+
+
+@app.cell(hide_code=True)
+def _(mo):
+    mo.md(r"""
+    # Peer Network
+
+    The features above approximate a professional's peers by the colleagues at the same company in the same month. The paper's network reaches further, to everyone a professional has worked with. Two sparse graphs are built from the employment history:
+
+    - **Co-employment**: professionals × companies, weighted by the months a professional was employed at the company. Two professionals are neighbours when they share a company.
+    - **Mobility**: companies × companies, weighted by the transfers of professionals from a stint at one company to their next stint at the other.
+
+    Both are scipy sparse matrices, so a neighbourhood query is two sparse matrix-vector products rather than a walk over every professional's peers. When new months arrive, the graphs are advanced by adding the new months' employment and transfers to the existing matrices; the incremental refresh below keeps them in its state this way.
+    """)
+    return
+
+
+@app.cell
+def peer_network(np, os, pd, stint_month_range):
+    import scipy.sparse as sp
+
+
+    def _month_indexes(months):
+        return np.where(np.isnat(months), -1, months.astype(np.int64))
+
+
+    def advance_peer_graphs(graphs, stints, through_month):
+        """
+        Brings the peer graphs up to the month index `through_month`, from
+        `graphs` (None to build them from scratch).
+
+        `stints` is the encoded employment history, with the codes `graphs`
+        was built with and any new ids appended. Only the months after
+        graphs["through_month"] are added: the employment months of the
+        stints active in them, and the transfers to stints starting in them.
+        Returns the graphs as a dict of through_month, co_employment
+        (professionals x companies) and mobility (companies x companies)
+        CSR matrices.
+        """
+        professional = stints["professionalId"].to_numpy(dtype=np.int64)
+        company = stints["companyId"].to_numpy(dtype=np.int64)
+        first_month, last_month = (
+            _month_indexes(months) for months in stint_month_range(stints)
+        )
+        since_month = 0 if graphs is None else graphs["through_month"] + 1
+        shape = (int(professional.max(initial=-1)) + 1, int(company.max(initial=-1)) + 1)
+        if graphs is not None:
+            shape = tuple(int(n) for n in np.maximum(shape, graphs["co_employment"].shape))
+
+        # Months of every stint in since_month..through_month
+        months_added = (
+            np.minimum(last_month, through_month) - np.maximum(first_month, since_month) + 1
+        )
+        added = (
+            (first_month >= 0) & (months_added > 0) & (professional >= 0) & (company >= 0)
+        )
+        co_employment = sp.csr_matrix(
+            (months_added[added], (professional[added], company[added])), shape=shape
+        )
+
+        # Transfers: consecutive stints of a professional at different companies;
+        # stints starting in the same month are ordered by company code
+        order = np.lexsort((company, first_month, professional))
+        previous, following = order[:-1], order[1:]
+        transfer = (
+            (professional[previous] == professional[following])
+            & (company[previous] >= 0)
+            & (company[following] >= 0)
+            & (company[previous] != company[following])
+            & (first_month[following] >= since_month)
+            & (first_month[following] <= through_month)
+        )
+        mobility = sp.csr_matrix(
+            (
+                np.ones(int(transfer.sum()), dtype=np.int64),
+                (company[previous][transfer], company[following][transfer]),
+            ),
+            shape=(shape[1], shape[1]),
+        )
+
+        if graphs is not None:
+            previous_co_employment = graphs["co_employment"].copy()
+            previous_co_employment.resize(shape)
+            previous_mobility = graphs["mobility"].copy()
+            previous_mobility.resize((shape[1], shape[1]))
+            co_employment = co_employment + previous_co_employment
+            mobility = mobility + previous_mobility
+        return {
+            "through_month": int(through_month),
+            "co_employment": co_employment.tocsr(),
+            "mobility": mobility.tocsr(),
+        }
+
+
+    def _resized(matrix, shape):
+        matrix = matrix.copy()
+        matrix.resize(shape)
+        return matrix
+
+
+    def patch_peer_graphs(graphs, previous_stints, stints, professionals):
+        """
+        Rebuilds the part of `graphs`, built from `previous_stints`, that
+        comes from the stints of `professionals`, from their stints in
+        `stints` instead, up to the same month. Both stint tables are
+        encoded with the same codes. Employment months and transfers are
+        both counted per professional, so the other professionals' part
+        stays as it is.
+        """
+        through_month = graphs["through_month"]
+        previous_part, part = (
+            advance_peer_graphs(
+                None,
+                table[table["professionalId"].isin(professionals)],
+                through_month,
+            )
+            for table in (previous_stints, stints)
+        )
+        shape = tuple(
+            int(n)
+            for n in np.maximum.reduce(
+                [g["co_employment"].shape for g in (graphs, previous_part, part)]
+            )
+        )
+        patched = {"through_month": through_month}
+        for name, graph_shape in (
+            ("co_employment", shape),
+            ("mobility", (shape[1], shape[1])),
+        ):
+            matrix = (
+                _resized(graphs[name], graph_shape)
+                - _resized(previous_part[name], graph_shape)
+                + _resized(part[name], graph_shape)
+            ).tocsr()
+            matrix.eliminate_zeros()
+            patched[name] = matrix
+        return patched
+
+
+    def save_peer_graphs(graphs, directory):
+        """Writes the CSR matrices of `graphs` to `directory`, one .npz each."""
+        os.makedirs(directory, exist_ok=True)
+        for name in ("co_employment", "mobility"):
+            sp.save_npz(os.path.join(directory, f"{name}.npz"), graphs[name])
+
+
+    def load_peer_graphs(directory, through_month):
+        """The graphs written by save_peer_graphs, built up to `through_month`."""
+        return {
+            "through_month": int(through_month),
+            **{
+                name: sp.load_npz(os.path.join(directory, f"{name}.npz")).tocsr()
+                for name in ("co_employment", "mobility")
+            },
+        }
+
+
+    def _departed(stints, month, lookback_months):
+        """Whether each stint ended within the `lookback_months` up to `month`."""
+        _, last_month = stint_month_range(stints)
+        has_ended = stints["endDate"].notna().to_numpy()
+        departure_month = _month_indexes(last_month) + 1
+        return has_ended & (departure_month > month - lookback_months) & (departure_month <= month)
+
+
+    def neighbourhood_departures(graphs, stints, month, lookback_months):
+        """
+        For every professional, the co-employment neighbours who left a
+        company within the `lookback_months` up to the month index `month`.
+
+        Neighbours are counted by shared company, so a neighbour met at two
+        companies counts twice, and a professional is not their own
+        neighbour. Returns neighbours, departed_neighbours and
+        pct_departed_neighbours, indexed by professionalId code.
+        """
+        linked = (graphs["co_employment"] > 0).astype(np.int64)
+        departed = np.zeros(linked.shape[0], dtype=np.int64)
+        ended = _departed(stints, month, lookback_months) & (
+            stints["professionalId"].to_numpy() >= 0
+        )
+        departed[np.unique(stints["professionalId"].to_numpy()[ended])] = 1
+
+        n_companies = np.asarray(linked.sum(axis=1)).ravel()
+        staff = np.asarray(linked.sum(axis=0)).ravel()
+        neighbours = linked @ staff - n_companies
+        departed_neighbours = linked @ (linked.T @ departed) - n_companies * departed
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pct = np.where(neighbours > 0, departed_neighbours / neighbours * 100, np.nan)
+        return pd.DataFrame(
+            {
+                "neighbours": neighbours,
+                "departed_neighbours": departed_neighbours,
+                "pct_departed_neighbours": pct,
+            }
+        ).rename_axis("professionalId")
+
+
+    def mobility_neighbourhood_departures(graphs, stints, month, lookback_months):
+        """
+        For every company, the departures within the `lookback_months` up to
+        the month index `month` at the companies it exchanges staff with,
+        weighted by the transfers between them in either direction.
+        Returns transfer_weight and weighted_departures, indexed by
+        companyId code.
+        """
+        exchange = graphs["mobility"] + graphs["mobility"].T
+        ended = _departed(stints, month, lookback_months) & (
+            stints["companyId"].to_numpy() >= 0
+        )
+        departures = np.bincount(
+            stints["companyId"].to_numpy()[ended], minlength=exchange.shape[0]
+        )[: exchange.shape[0]]
+        weight = np.asarray(exchange.sum(axis=1)).ravel()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weighted = np.where(weight > 0, (exchange @ departures) / weight, np.nan)
+        return pd.DataFrame(
+            {"transfer_weight": weight, "weighted_departures": weighted}
+        ).rename_axis("companyId")
+    return (
+        advance_peer_graphs,
+        load_peer_graphs,
+        mobility_neighbourhood_departures,
+        neighbourhood_departures,
+        patch_peer_graphs,
+        save_peer_graphs,
+    )
+
+
+@app.cell
+def _(
+    OUT_OF_CORE,
+    advance_peer_graphs,
+    encoded_sfc_professional_company_employment_history,
+    mo,
+    np,
+    pd,
+    sfc_id_lookups,
+):
+    mo.stop(OUT_OF_CORE, mo.md("Skipped in the batch scripts"))
+
+    # Through the last month the register records a start or end in, so the
+    # graphs do not depend on the day the notebook is run
+    _last_date = max(
+        encoded_sfc_professional_company_employment_history[column].max()
+        for column in ["effectiveDate", "endDate"]
+    )
+    sfc_peer_graphs = advance_peer_graphs(
+        None,
+        encoded_sfc_professional_company_employment_history,
+        through_month=int(
+            _last_date.to_datetime64().astype("datetime64[M]").astype(np.int64)
+        ),
+    )
+
+
+    def _graph_summary(name, matrix, rows, columns):
+        return {
+            "graph": name,
+            rows: matrix.shape[0],
+            columns: matrix.shape[1],
+            "edges": matrix.nnz,
+            "MB": (matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes) / 1e6,
+        }
+
+
+    _mobility = sfc_peer_graphs["mobility"].tocoo()
+    _company_names = np.asarray(sfc_id_lookups["companyId"], dtype=object)
+    _top_flows = (
+        pd.DataFrame(
+            {
+                "from_company": _company_names[_mobility.row],
+                "to_company": _company_names[_mobility.col],
+                "transfers": _mobility.data,
+            }
+        )
+        .sort_values("transfers", ascending=False, ignore_index=True)
+        .head(20)
+    )
+
+    mo.vstack(
+        [
+            mo.ui.table(
+                pd.DataFrame(
+                    [
+                        _graph_summary(
+                            "co-employment",
+                            sfc_peer_graphs["co_employment"],
+                            "professionals",
+                            "companies",
+                        ),
+                        _graph_summary(
+                            "mobility",
+                            sfc_peer_graphs["mobility"],
+                            "from companies",
+                            "to companies",
+                        ),
+                    ]
+                ).round(2)
+            ),
+            mo.md("### Largest transfer flows between companies"),
+            mo.ui.table(_top_flows),
+        ]
+    )
+    return (sfc_peer_graphs,)
+
+
+@app.cell(hide_code=True)
+def _(mo):
+    mo.md(r"""
+    ## Incremental Refresh
+
+    Each month a fresh register is scraped. Instead of rebuilding every snapshot month from 2003, refresh a state directory with the script in the repository's `scripts/` folder, where the register is:
+
+    ```
+    python scripts/incremental_state.py <dir> [--through-month YYYY-MM]
+    ```
+
+    The state keeps the encoded employment history, stable id lookups, the peer graphs and two Parquet tables partitioned by `snapshot_month`: the snapshot rows and the company-level peer departure percentages of every lookback window. A refresh diffs the new employment history against the stored one, patches only the snapshot months whose rows changed, appends the new months, and recomputes the features of the affected company-months: those whose staff changed, and the same companies x months later. The peer graphs are patched for the professionals whose stints changed, then advanced by the new months.
+    """)
+    return
+
+
+@app.cell(hide_code=True)
+def _(mo):
+    mo.md(r"""
+    ## Out-of-core Pipeline
+
+    The full 2003–2026 snapshot, and its feature columns, do not fit in memory on a small machine. The out-of-core pipeline in the repository's `scripts/` folder runs snapshot → `left_next_month` → lookback features → turnover metrics a chunk of months at a time instead:
+
+    ```
+    python scripts/out_of_core_metrics.py <spill dir> [--from-year 2003] [--to-year 2026] [--n-jobs N]
+    ```
+
+    Each chunk's snapshot rows are spilled to Parquet partitions by `snapshot_month`, and the lookback windows read the months before the chunk back from the spill. The metrics of every month are final once its chunk is done, so only the per-month metrics, written to `<spill dir>/metrics.parquet`, are ever held for the whole range. The 2003–2026 metrics charted at the top are computed this way at build time.
+
+    Add `--n-jobs N` (`-1` for every core) to the script, or to a run of this notebook, to count peer departures in N worker processes. The months are sharded into partitions, together with the earlier months their lookback windows reach back to, and the windows into groups when there are more processes than partitions.
+    """)
+    return
+
+
 if __name__ == "__main__":
     app.run()
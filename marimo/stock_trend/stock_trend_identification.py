@@ -6,6 +6,7 @@
 #     "marimo==0.13.6",
 #     "numpy==2.2.5",
 #     "pandas==2.2.3",
+#     "pyarrow==20.0.0",
 #     "sqlglot==26.16.4",
 # ]
 # ///
@@ -94,31 +95,38 @@ def _():
 
 
 @app.cell
-def load_all_data(pd):
+def load_all_data(mo, pd):
     base_url = "https://raw.githubusercontent.com/kenho811/home_data_centre_public_mirror/refs/heads/main/marimo/stock_trend"
 
-    hk_indices_stocks_df: pd.DataFrame = pd.read_csv(
-        base_url + "/public/hk_index_constituent_stock.csv"
-    )
 
-    sample_stock_prices: pd.DataFrame = pd.read_csv(
-        base_url
-        + "/public/0001_2216_9992_average_price_from_2018Jan01_to_2025May02.csv"
-    )
+    def _read_public_table(name: str) -> pd.DataFrame:
+        # Parquet copies are written next to the published notebook at build
+        # time; fall back to the CSV on GitHub when there is none, or when no
+        # parquet engine is installed. Missing files and failed fetches are
+        # OSErrors; a bad file should still raise
+        try:
+            return pd.read_parquet(
+                str(mo.notebook_location() / "public" / f"{name}.parquet")
+            )
+        except (OSError, ImportError):
+            return pd.read_csv(base_url + f"/public/{name}.csv")
 
-    hk_indices_df: pd.DataFrame = pd.read_csv(
-        base_url + "/public/hk_index_name.csv"
-    )
 
-    symbols_df: pd.DataFrame = pd.read_csv(
-        base_url + "/public/stock_display_name.csv"
+    hk_indices_stocks_df: pd.DataFrame = _read_public_table(
+        "hk_index_constituent_stock"
     )
 
-    trend_config_df: pd.DataFrame = pd.read_csv(
-        base_url + "/public/stock_trend_config.csv"
+    sample_stock_prices: pd.DataFrame = _read_public_table(
+        "0001_2216_9992_average_price_from_2018Jan01_to_2025May02"
     )
-    all_stock_trend = pd.read_csv(
-        base_url + "/public/stock_trend_from_2018Jan01_to_2025May02.csv"
+
+    hk_indices_df: pd.DataFrame = _read_public_table("hk_index_name")
+
+    symbols_df: pd.DataFrame = _read_public_table("stock_display_name")
+
+    trend_config_df: pd.DataFrame = _read_public_table("stock_trend_config")
+    all_stock_trend = _read_public_table(
+        "stock_trend_from_2018Jan01_to_2025May02"
     )
 
     all_stock_trend["from_utc_datetime"] = pd.to_datetime(
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""Benchmark the employment-history engine of the network-contagion notebook.
+
+The notebook builds each SFC professional's employment history with
+`coalesce_employment_history`, a sort-once NumPy engine. That engine
+replaced the window-function SQL kept below as REFERENCE_SQL. For every
+register size, this script generates a synthetic licence register, runs
+both implementations, checks that their outputs are identical and
+reports the timings.
+
+Usage: python scripts/bench_employment_history.py [--sizes N [N ...]] [--repeat R]
+"""
+
+import sys
+import time
+import argparse
+import importlib.util
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+import duckdb
+import numpy as np
+import pandas as pd
+import polars as pl
+import pyarrow as pa
+import pyarrow.compute as pc
+
+NOTEBOOK_PATH = (
+    Path(__file__).resolve().parent.parent
+    / "marimo"
+    / "network_contagion_impact_on_employee_turnover"
+    / "network_contagion_impact_on_employee_turnover.py"
+)
+
+# The query the engine replaced, over a `licenses` table
+REFERENCE_SQL = """
+with merged_licenses as (
+    select
+        sfcid,
+        fullName,
+        prinCeName,
+        min(effectiveDate) as effectiveDate,
+        max(endDate) as endDate
+    from (
+        select
+            *,
+            sum(is_new_start) over (partition by sfcid, prinCeName order by effectiveDate, endDate) as overlap_grp
+        from (
+            select
+                sfcid, fullName, prinCeName, effectiveDate, endDate,
+                case when effectiveDate <= max(endDate) over (
+                    partition by sfcid, prinCeName
+                    order by effectiveDate, endDate
+                    rows between unbounded preceding and 1 preceding
+                ) then 0 else 1 end as is_new_start
+            from licenses
+        ) t1
+    ) t2
+    group by sfcid, fullName, prinCeName, overlap_grp
+),
+add_incre as (
+    select
+        *,
+        case when lag(split_part(prinCeName, ' ', 1)) over (partition by sfcid order by effectiveDate, endDate, prinCeName)
+             is distinct from split_part(prinCeName, ' ', 1)
+             then 1 else 0 end as _incre,
+    from merged_licenses
+),
+add_group as (
+    select
+        *,
+        sum(_incre) over (partition by sfcid order by effectiveDate, endDate, prinCeName rows unbounded preceding) as grp
+    from add_incre
+)
+select
+    sfcid,
+    fullName,
+    fullName || ' (' || sfcid || ') ' as professionalId,
+    split_part(min(prinCeName), ' ', 1) as companyId,
+    array_agg(distinct prinCeName) as princCeNames,
+    min(effectiveDate) as effectiveDate,
+    max(endDate) as endDate,
+    max(endDate) - min(effectiveDate) as tenure_days
+from add_group
+group by sfcid, fullName, grp
+order by sfcid, min(effectiveDate)
+"""
+
+GROUPS = [f"Group{i:04d}" for i in range(2_000)]
+SUFFIXES = ["Securities Limited", "Futures Limited", "Asset Management Limited"]
+
+
+def synthetic_register(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """A licence register with overlapping licences, group moves and NULLs."""
+    rng = np.random.default_rng(seed)
+    n_professionals = max(1, n_rows // 4)
+    n_groups = max(2, min(len(GROUPS), n_rows // 200))
+
+    professional = rng.integers(0, n_professionals, n_rows)
+    group = rng.integers(0, n_groups, n_rows)
+    firm = np.char.add(
+        np.char.add(np.array(GROUPS)[group], " "),
+        np.array(SUFFIXES)[rng.integers(0, len(SUFFIXES), n_rows)],
+    ).astype(object)
+    firm[rng.random(n_rows) < 0.001] = None
+
+    effective = np.datetime64("2003-04-01") + rng.integers(0, 8_000, n_rows)
+    end = (effective + rng.integers(-30, 3_000, n_rows)).astype("datetime64[D]")
+    end[rng.random(n_rows) < 0.15] = np.datetime64("NaT")
+    effective[rng.random(n_rows) < 0.001] = np.datetime64("NaT")
+
+    full_name = np.char.add("Person ", professional.astype(str)).astype(object)
+    # The same professional is occasionally registered under another spelling
+    renamed = rng.random(n_rows) < 0.01
+    full_name[renamed] = np.char.add(full_name[renamed].astype(str), " Jr")
+
+    return pd.DataFrame(
+        {
+            "sfcid": np.char.add("A", professional.astype(str)),
+            "fullName": full_name,
+            "prinCeName": firm,
+            "effectiveDate": pd.Series(effective).astype("datetime64[ms]"),
+            "endDate": pd.Series(end).astype("datetime64[ms]"),
+        }
+    ).astype({"effectiveDate": pd.ArrowDtype(pa.date32()), "endDate": pd.ArrowDtype(pa.date32())})
+
+
+def load_engine() -> Callable[[pd.DataFrame], pl.DataFrame]:
+    """Import the notebook and run only its engine cell."""
+    spec = importlib.util.spec_from_file_location(NOTEBOOK_PATH.stem, NOTEBOOK_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    _, defs = module.licence_interval_engine.run(np=np, pa=pa, pc=pc, pd=pd, pl=pl)
+    return defs["coalesce_employment_history"]
+
+
+def run_reference(licenses: pd.DataFrame) -> pl.DataFrame:
+    return duckdb.sql(REFERENCE_SQL).pl()
+
+
+def canonical(history: pl.DataFrame) -> pl.DataFrame:
+    """Sort rows and list elements, whose order SQL leaves unspecified."""
+    return history.with_columns(
+        pl.col("princCeNames").list.sort(nulls_last=True)
+    ).sort(history.columns[:4] + ["effectiveDate", "endDate"], nulls_last=True)
+
+
+def best_of(repeat: int, function: Callable, *args) -> Tuple[float, object]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main(sizes: List[int], repeat: int) -> int:
+    engine = load_engine()
+
+    print(f"{'Register rows':>14} {'History rows':>13} {'SQL (s)':>9} {'Engine (s)':>11} {'Speedup':>8}")
+    mismatches = 0
+    for n_rows in sizes:
+        licenses = synthetic_register(n_rows)
+        sql_seconds, expected = best_of(repeat, run_reference, licenses)
+        engine_seconds, actual = best_of(repeat, engine, licenses)
+
+        if not canonical(expected).equals(canonical(actual)):
+            print(f"Error: outputs differ for {n_rows:,} register rows")
+            mismatches += 1
+        print(
+            f"{n_rows:>14,} {len(actual):>13,} {sql_seconds:>9.3f} "
+            f"{engine_seconds:>11.3f} {sql_seconds / engine_seconds:>7.1f}x"
+        )
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the employment-history engine against the SQL it replaced"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000, 1_000_000],
+        help="Register sizes to benchmark, in licence rows",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Runs per size; the fastest is reported (default: 3)",
+    )
+    args = parser.parse_args()
+    sys.exit(main(args.sizes, args.repeat))
@@ -2,19 +2,84 @@
 #!/usr/bin/env python3
 
 import os
+import re
+import sys
+import json
+import time
+import gzip
+import shutil
+import hashlib
 import subprocess
 import argparse
-from typing import List
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Dict, List, Optional
 from pathlib import Path
 
 from jinja2 import Environment, FileSystemLoader
 
+from precompute import has_precompute_cells, missing_artifacts
 
-def export_html_wasm_as_app(notebook_path: str, output_dir: str) -> bool:
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+try:
+    import pyarrow
+    import pyarrow.csv
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - pyarrow is optional
+    pyarrow = None
+
+
+@dataclass
+class ExportResult:
+    """Outcome of exporting a single notebook."""
+
+    notebook_path: str
+    succeeded: bool
+    elapsed_seconds: float
+    stderr: str = ""
+    cached: bool = False
+    peak_rss_bytes: Optional[int] = None
+
+
+def run_and_measure(cmd: List[str]) -> tuple:
+    """Run a command, capturing its output and its peak resident set size.
+
+    The peak RSS comes from `os.wait4`, so it is that of the process itself,
+    and is None on platforms without it.
+
+    Returns:
+        tuple: (returncode, stdout, stderr, peak RSS in bytes or None)
+    """
+    with tempfile.TemporaryFile("w+") as stdout, tempfile.TemporaryFile("w+") as stderr:
+        process = subprocess.Popen(cmd, stdout=stdout, stderr=stderr, text=True)
+        peak_rss_bytes = None
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+            peak_rss_bytes = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+        else:
+            process.wait()
+
+        stdout.seek(0)
+        stderr.seek(0)
+        return process.returncode, stdout.read(), stderr.read(), peak_rss_bytes
+
+
+def export_html_wasm_as_app(notebook_path: str, output_dir: str) -> ExportResult:
     """Export a single marimo notebook to HTML format.
 
+    Output of the export subprocess is captured rather than printed, so that
+    several exports can run side by side without interleaving their logs.
+
     Returns:
-        bool: True if export succeeded, False otherwise
+        ExportResult: whether the export succeeded, how long it took, the
+        captured stderr and the peak RSS of the export subprocess
     """
     output_path = notebook_path.replace(".py", ".html")
 
@@ -23,20 +88,640 @@ def export_html_wasm_as_app(notebook_path: str, output_dir: str) -> bool:
     print(f"Exporting {notebook_path} to {output_path} as app")
     cmd.extend(["--mode", "run"])
 
+    start = time.perf_counter()
     try:
         output_file = os.path.join(output_dir, output_path)
         os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        release_optimised_files(os.path.dirname(output_file))
 
         cmd.extend([notebook_path, "-o", output_file])
-        subprocess.run(cmd, capture_output=True, text=True, check=True)
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"Error exporting {notebook_path}:")
-        print(e.stderr)
-        return False
+        returncode, _, stderr, peak_rss_bytes = run_and_measure(cmd)
+        return ExportResult(
+            notebook_path,
+            returncode == 0,
+            time.perf_counter() - start,
+            stderr,
+            peak_rss_bytes=peak_rss_bytes,
+        )
     except Exception as e:
-        print(f"Unexpected error exporting {notebook_path}: {e}")
-        return False
+        return ExportResult(
+            notebook_path,
+            False,
+            time.perf_counter() - start,
+            f"Unexpected error: {e}",
+        )
+
+
+def export_notebooks(
+        all_notebooks: List[str], output_dir: str, jobs: int
+) -> List[ExportResult]:
+    """Export notebooks concurrently, at most `jobs` at a time.
+
+    Every export is its own `marimo export` subprocess, so a thread pool is
+    enough to bound the number of export processes running at once. Each
+    notebook's stderr is printed as soon as that notebook finishes.
+    """
+    results: List[ExportResult] = []
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(all_notebooks)))) as pool:
+        futures = [
+            pool.submit(export_html_wasm_as_app, nb, output_dir)
+            for nb in all_notebooks
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            status = "Exported" if result.succeeded else "Error exporting"
+            print(f"{status} {result.notebook_path} in {result.elapsed_seconds:.1f}s")
+            if result.stderr.strip():
+                print(result.stderr.rstrip())
+            results.append(result)
+
+    # Report in the order the notebooks were discovered, not completion order
+    order = {nb: i for i, nb in enumerate(all_notebooks)}
+    return sorted(results, key=lambda r: order[r.notebook_path])
+
+
+# Bump to invalidate every cached export, e.g. when the export command changes
+CACHE_FORMAT_VERSION = 2
+
+# CSV columns stored as real timestamps when converted to Parquet
+DATETIME_COLUMNS = [
+    "as_of_date",
+    "as_of_date_tz08",
+    "ccass_date",
+    "utc_datetime",
+    "from_utc_datetime",
+    "to_utc_datetime",
+    "effectiveDate",
+    "endDate",
+]
+
+# PEP 723 inline script metadata block, as in the reference implementation
+PEP_723_REGEX = re.compile(
+    r"(?m)^# /// (?P<type>[a-zA-Z0-9-]+)$\s(?P<content>(^#(| .*)$\s)+)^# ///$"
+)
+
+
+def get_marimo_version() -> str:
+    """Return the version of the marimo CLI used for exporting."""
+    try:
+        completed = subprocess.run(
+            ["marimo", "--version"], capture_output=True, text=True, check=True
+        )
+        return completed.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def get_notebook_output_dir(notebook_path: str, output_dir: str) -> str:
+    """Return the directory an exported notebook and its assets are written to.
+
+    Every notebook lives in its own `marimo/<dir>`, so this directory holds
+    exactly one notebook's export.
+    """
+    return os.path.dirname(os.path.join(output_dir, notebook_path))
+
+
+def compute_cache_key(notebook_path: str, marimo_version: str) -> str:
+    """Hash everything that affects a notebook's export.
+
+    That is the notebook source, its PEP 723 dependency header, every file
+    under its `public/` folder, its `layouts/*.json` and the marimo version.
+    """
+    notebook_dir = Path(notebook_path).parent
+    source = Path(notebook_path).read_bytes()
+
+    digest = hashlib.sha256()
+    digest.update(f"format={CACHE_FORMAT_VERSION}\n".encode())
+    digest.update(f"marimo={marimo_version}\n".encode())
+    digest.update(hashlib.sha256(source).hexdigest().encode())
+
+    header = PEP_723_REGEX.search(source.decode("utf-8", errors="replace"))
+    digest.update(f"\nheader={header.group(0) if header else ''}\n".encode())
+
+    assets = sorted(
+        path
+        for path in [
+            *notebook_dir.joinpath("public").rglob("*"),
+            *notebook_dir.joinpath("layouts").glob("*.json"),
+        ]
+        if path.is_file()
+    )
+    for path in assets:
+        digest.update(path.relative_to(notebook_dir).as_posix().encode())
+        digest.update(hashlib.sha256(path.read_bytes()).hexdigest().encode())
+
+    return digest.hexdigest()
+
+
+def convert_csvs_to_parquet(public_dir: str) -> None:
+    """Write a Parquet copy next to every CSV in an exported `public/` folder.
+
+    Columns are typed on read. The columns in DATETIME_COLUMNS become
+    timestamps. Files are written zstd-compressed with dictionary-encoded
+    columns, so the notebooks can load them without parsing CSV at
+    startup. Notebooks fall back to the CSV when no Parquet file exists.
+    """
+    csv_paths = sorted(Path(public_dir).glob("*.csv"))
+    if not csv_paths:
+        return
+    if pyarrow is None:
+        print("Warning: pyarrow is not installed; skipping CSV to Parquet conversion")
+        return
+
+    convert_options = pyarrow.csv.ConvertOptions(
+        column_types={column: pyarrow.timestamp("us") for column in DATETIME_COLUMNS},
+        timestamp_parsers=[pyarrow.csv.ISO8601, "%Y-%m-%d", "%Y-%m-%d %H:%M:%S"],
+    )
+    for csv_path in csv_paths:
+        parquet_path = csv_path.with_suffix(".parquet")
+        try:
+            table = pyarrow.csv.read_csv(csv_path, convert_options=convert_options)
+            pyarrow.parquet.write_table(
+                table,
+                parquet_path,
+                compression="zstd",
+                use_dictionary=True,
+            )
+        except (pyarrow.ArrowException, OSError) as e:
+            print(f"Warning: Could not convert {csv_path} to Parquet: {e}")
+            parquet_path.unlink(missing_ok=True)
+            continue
+        print(
+            f"Converted {csv_path} to Parquet "
+            f"({csv_path.stat().st_size:,} -> {parquet_path.stat().st_size:,} bytes)"
+        )
+
+
+def load_cache_manifest(cache_dir: str) -> Dict[str, Dict]:
+    """Load the cache manifest, mapping notebook paths to their cache entries."""
+    manifest_path = os.path.join(cache_dir, "manifest.json")
+    try:
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (IOError, ValueError) as e:
+        print(f"Warning: Ignoring unreadable build cache manifest: {e}")
+        return {}
+
+
+def save_cache_manifest(cache_dir: str, manifest: Dict[str, Dict]) -> None:
+    """Write the cache manifest."""
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def replace_tree(source_dir: str, target_dir: str) -> None:
+    """Replace `target_dir` with a copy of `source_dir`."""
+    shutil.rmtree(target_dir, ignore_errors=True)
+    shutil.copytree(source_dir, target_dir)
+
+
+def restore_from_cache(
+        notebook_path: str, output_dir: str, cache_dir: str, entry: Optional[Dict]
+) -> Optional[ExportResult]:
+    """Copy a cached export into the output directory.
+
+    Returns:
+        ExportResult for the restored notebook, or None on a cache miss
+    """
+    if not entry:
+        return None
+
+    cached_dir = os.path.join(cache_dir, entry["key"])
+    if not os.path.isdir(cached_dir):
+        return None
+
+    start = time.perf_counter()
+    replace_tree(cached_dir, get_notebook_output_dir(notebook_path, output_dir))
+    return ExportResult(
+        notebook_path, True, time.perf_counter() - start, cached=True
+    )
+
+
+def store_in_cache(
+        result: ExportResult,
+        key: str,
+        output_dir: str,
+        cache_dir: str,
+        manifest: Dict[str, Dict],
+) -> None:
+    """Copy a fresh export into the cache and record it in the manifest."""
+    previous = manifest.get(result.notebook_path)
+    replace_tree(
+        get_notebook_output_dir(result.notebook_path, output_dir),
+        os.path.join(cache_dir, key),
+    )
+    if previous and previous["key"] != key:
+        shutil.rmtree(os.path.join(cache_dir, previous["key"]), ignore_errors=True)
+
+    manifest[result.notebook_path] = {
+        "key": key,
+        "export_seconds": round(result.elapsed_seconds, 3),
+    }
+
+
+def build_notebooks(
+        all_notebooks: List[str],
+        output_dir: str,
+        jobs: int,
+        cache_dir: str,
+        force: bool = False,
+) -> List[ExportResult]:
+    """Export notebooks, copying unchanged ones from the build cache.
+
+    A notebook is a cache hit when its cache key matches the one recorded in
+    the manifest. With `force`, every notebook is exported and the cache is
+    refreshed with the new exports.
+    """
+    marimo_version = get_marimo_version()
+    manifest = load_cache_manifest(cache_dir)
+    keys = {nb: compute_cache_key(nb, marimo_version) for nb in all_notebooks}
+
+    results: List[ExportResult] = []
+    misses: List[str] = []
+    for nb in all_notebooks:
+        entry = manifest.get(nb)
+        restored = None
+        if not force and entry and entry["key"] == keys[nb]:
+            restored = restore_from_cache(nb, output_dir, cache_dir, entry)
+        if restored:
+            print(f"Cache hit: {nb}")
+            results.append(restored)
+        else:
+            print(f"Cache miss: {nb}")
+            misses.append(nb)
+
+    if misses:
+        for result in export_notebooks(misses, output_dir, jobs):
+            if result.succeeded:
+                convert_csvs_to_parquet(
+                    os.path.join(
+                        get_notebook_output_dir(result.notebook_path, output_dir),
+                        "public",
+                    )
+                )
+                store_in_cache(
+                    result, keys[result.notebook_path], output_dir, cache_dir, manifest
+                )
+            results.append(result)
+        save_cache_manifest(cache_dir, manifest)
+
+    print(
+        f"Build cache: {len(all_notebooks) - len(misses)} hit(s), "
+        f"{len(misses)} miss(es)"
+    )
+
+    order = {nb: i for i, nb in enumerate(all_notebooks)}
+    return sorted(results, key=lambda r: order[r.notebook_path])
+
+
+def print_export_summary(results: List[ExportResult]) -> None:
+    """Print a per-notebook wall-clock table of the exports."""
+    width = max(len("Notebook"), *(len(r.notebook_path) for r in results))
+    print()
+    print(f"{'Notebook':<{width}}  {'Status':<6}  {'Seconds':>8}")
+    print(f"{'-' * width}  {'-' * 6}  {'-' * 8}")
+    for r in results:
+        status = "CACHED" if r.cached else "OK" if r.succeeded else "FAILED"
+        print(f"{r.notebook_path:<{width}}  {status:<6}  {r.elapsed_seconds:>8.1f}")
+
+
+# Text formats worth serving precompressed
+COMPRESSIBLE_SUFFIXES = {".html", ".js", ".mjs", ".css", ".csv", ".json", ".svg"}
+COMPRESSED_SUFFIXES = {".gz": "gzip", ".br": "brotli"}
+
+
+@dataclass
+class SizeReport:
+    """Bytes of the exported site before and after asset optimisation."""
+
+    files: int = 0
+    duplicates: int = 0
+    bytes_before: int = 0
+    bytes_after_dedup: int = 0
+    bytes_over_the_wire: int = 0
+
+
+def is_compressed_sibling(path: Path) -> bool:
+    """Whether `path` is a .gz/.br file written next to a compressible file."""
+    return (
+        path.suffix in COMPRESSED_SUFFIXES
+        and Path(path.stem).suffix in COMPRESSIBLE_SUFFIXES
+    )
+
+
+def release_optimised_files(directory: str) -> None:
+    """Undo asset optimisation in one notebook's output directory.
+
+    Deduplicated files are hard links shared with other notebooks, so they
+    are unlinked before an export writes into the directory. Otherwise the
+    export would overwrite the other notebooks' copies as well. Precompressed
+    siblings are removed as they would be stale after the export.
+    """
+    for path in Path(directory).rglob("*"):
+        if path.is_file() and (path.stat().st_nlink > 1 or is_compressed_sibling(path)):
+            path.unlink()
+
+
+def file_digest(path: Path) -> str:
+    """Return the sha256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(source: Path, target: Path) -> None:
+    """Atomically replace `target` with a hard link to `source`.
+
+    Falls back to a copy where hard links are not supported.
+    """
+    temporary = target.with_name(f".{target.name}.tmp")
+    try:
+        os.link(source, temporary)
+    except OSError:
+        shutil.copyfile(source, temporary)
+    os.replace(temporary, target)
+
+
+def write_atomically(target: Path, data: bytes) -> None:
+    """Write `data` to `target` without writing through an existing hard link."""
+    temporary = target.with_name(f".{target.name}.tmp")
+    temporary.write_bytes(data)
+    os.replace(temporary, target)
+
+
+def compress_bytes(data: bytes, encoding: str) -> bytes:
+    """Compress with the given content encoding at its highest level."""
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return brotli.compress(data, quality=11)
+
+
+def optimise_site(output_dir: str, cache_dir: Optional[str] = None) -> SizeReport:
+    """Deduplicate identical files and write precompressed siblings.
+
+    Files with identical content, such as the marimo frontend assets every
+    export ships and public/ files shared between notebooks, are replaced by
+    hard links to a single copy. Every compressible text file gets `.gz` and,
+    when the optional `brotli` package is installed, `.br` siblings that
+    static hosts can serve to clients accepting those encodings. Compressed
+    payloads are cached by content hash under `cache_dir`, so unchanged
+    assets are not recompressed on the next build.
+
+    This only pays off when the site is served from this directory by a
+    server that honours precompressed siblings, e.g. nginx with
+    gzip_static. GitHub Pages compresses on its own and ignores the
+    siblings, and its artifact upload dereferences hard links, so the
+    deploy workflow builds with --no-optimise.
+    """
+    encodings = ["gzip"] + (["brotli"] if brotli else [])
+    if brotli is None:
+        print("Warning: brotli is not installed; skipping .br files")
+
+    compressed_cache = Path(cache_dir, "compressed") if cache_dir else None
+    if compressed_cache:
+        compressed_cache.mkdir(parents=True, exist_ok=True)
+
+    report = SizeReport()
+    first_copies: Dict[str, Path] = {}
+    wire_sizes: Dict[str, int] = {}
+
+    for path in sorted(Path(output_dir).rglob("*")):
+        if not path.is_file() or is_compressed_sibling(path):
+            continue
+
+        size = path.stat().st_size
+        digest = file_digest(path)
+        report.files += 1
+        report.bytes_before += size
+
+        first_copy = first_copies.get(digest)
+        if first_copy is None:
+            first_copies[digest] = path
+            report.bytes_after_dedup += size
+        else:
+            report.duplicates += 1
+            if not os.path.samefile(first_copy, path):
+                link_or_copy(first_copy, path)
+
+        if path.suffix not in COMPRESSIBLE_SUFFIXES:
+            report.bytes_over_the_wire += size
+            continue
+
+        if digest not in wire_sizes:
+            wire_sizes[digest] = size
+            data = None
+            for suffix, encoding in COMPRESSED_SUFFIXES.items():
+                if encoding not in encodings:
+                    continue
+                target = Path(f"{path}{suffix}")
+                cached = compressed_cache / f"{digest}{suffix}" if compressed_cache else None
+                if cached is not None and cached.exists():
+                    link_or_copy(cached, target)
+                else:
+                    data = path.read_bytes() if data is None else data
+                    write_atomically(target, compress_bytes(data, encoding))
+                    if cached is not None:
+                        shutil.copyfile(target, cached)
+                wire_sizes[digest] = min(wire_sizes[digest], target.stat().st_size)
+        else:
+            for suffix in COMPRESSED_SUFFIXES:
+                sibling = Path(f"{first_copies[digest]}{suffix}")
+                if sibling.exists():
+                    link_or_copy(sibling, Path(f"{path}{suffix}"))
+
+        report.bytes_over_the_wire += wire_sizes[digest]
+
+    return report
+
+
+def print_size_report(report: SizeReport) -> None:
+    """Print how many bytes asset optimisation saved."""
+
+    def megabytes(n: int) -> str:
+        return f"{n / 1_000_000:>9.1f} MB"
+
+    def saving(n: int) -> str:
+        if not report.bytes_before:
+            return ""
+        return f"  ({100 * (1 - n / report.bytes_before):.0f}% smaller)"
+
+    print()
+    print("Asset optimisation (local serving only; not applied on GitHub Pages)")
+    print(f"  Files:                {report.files} ({report.duplicates} duplicates hard-linked)")
+    print(f"  Bytes before:         {megabytes(report.bytes_before)}")
+    print(
+        f"  Bytes after dedup:    {megabytes(report.bytes_after_dedup)}"
+        f"{saving(report.bytes_after_dedup)}"
+    )
+    print(
+        f"  Bytes served:         {megabytes(report.bytes_over_the_wire)}"
+        f"{saving(report.bytes_over_the_wire)}"
+    )
+    print(
+        "  (bytes served counts the smallest of raw/.gz/.br for every file, as a "
+        "server honouring precompressed siblings would send it)"
+    )
+
+
+def precompute_notebooks(all_notebooks: List[str]) -> bool:
+    """Run scripts/precompute.py for every notebook with precompute cells.
+
+    Each notebook runs in its own Python process, so its memory is released
+    before the exports start. Artifacts land in the notebook's
+    `public/precomputed/` folder, which changes its cache key.
+
+    Returns:
+        bool: True if every notebook was precomputed successfully
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "precompute.py")
+    succeeded = True
+    for nb in all_notebooks:
+        if not has_precompute_cells(nb):
+            continue
+        print(f"Precomputing {nb}")
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, script, nb])
+        print(f"Precomputed {nb} in {time.perf_counter() - start:.1f}s")
+        if completed.returncode != 0:
+            print(f"Error precomputing {nb}")
+            succeeded = False
+    return succeeded
+
+
+def warn_missing_precomputed(all_notebooks: List[str]) -> None:
+    """Warn about precompute cells whose artifacts were never committed.
+
+    Without them the published notebook falls back to what its cells can
+    compute in the browser.
+    """
+    for nb in all_notebooks:
+        missing = missing_artifacts(nb)
+        if missing:
+            print(
+                f"Warning: {nb} has no precomputed {', '.join(missing)}; run "
+                "scripts/build.py --precompute with its inputs and commit "
+                "public/precomputed/"
+            )
+
+
+# Relative increase over the previous benchmark run that counts as a regression
+BENCH_THRESHOLDS = {
+    "export_seconds": 0.25,
+    "peak_rss_bytes": 0.25,
+    "html_bytes": 0.05,
+    "asset_bytes": 0.05,
+}
+
+
+def get_git_commit() -> Optional[str]:
+    """Return the commit being built, if this is a git checkout."""
+    try:
+        completed = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return completed.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure_notebook(result: ExportResult, output_dir: str) -> Dict[str, Optional[float]]:
+    """Collect the benchmark metrics of one freshly exported notebook."""
+    html_path = Path(output_dir, result.notebook_path.replace(".py", ".html"))
+    notebook_output_dir = Path(get_notebook_output_dir(result.notebook_path, output_dir))
+    asset_bytes = sum(
+        path.stat().st_size
+        for path in notebook_output_dir.rglob("*")
+        if path.is_file() and path != html_path and not is_compressed_sibling(path)
+    )
+    return {
+        "export_seconds": round(result.elapsed_seconds, 3),
+        "peak_rss_bytes": result.peak_rss_bytes,
+        "html_bytes": html_path.stat().st_size if html_path.exists() else None,
+        "asset_bytes": asset_bytes,
+    }
+
+
+def load_previous_benchmark(history_path: str) -> Optional[Dict]:
+    """Return the last run recorded in the benchmark history, if any."""
+    try:
+        with open(history_path, "r") as f:
+            lines = [line for line in f if line.strip()]
+    except FileNotFoundError:
+        return None
+    return json.loads(lines[-1]) if lines else None
+
+
+def record_benchmark(
+        results: List[ExportResult], output_dir: str, history_path: str
+) -> Dict:
+    """Append this run's per-notebook metrics to the JSON-lines history."""
+    run = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": get_git_commit(),
+        "marimo_version": get_marimo_version(),
+        "notebooks": {
+            r.notebook_path: measure_notebook(r, output_dir)
+            for r in results
+            if r.succeeded
+        },
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(history_path)), exist_ok=True)
+    with open(history_path, "a") as f:
+        f.write(json.dumps(run, sort_keys=True) + "\n")
+    return run
+
+
+def print_benchmark_diff(
+        previous: Optional[Dict], current: Dict, thresholds: Dict[str, float]
+) -> int:
+    """Print every metric against the previous run and flag regressions.
+
+    Returns:
+        int: number of metrics that grew by more than their threshold
+    """
+    print()
+    if previous is None:
+        print("Benchmark: no previous run to compare against")
+    else:
+        print(
+            f"Benchmark against {previous.get('commit') or 'previous run'} "
+            f"({previous.get('timestamp')})"
+        )
+
+    regressions = 0
+    for notebook, metrics in current["notebooks"].items():
+        before = (previous or {}).get("notebooks", {}).get(notebook, {})
+        print(notebook)
+        for metric, value in metrics.items():
+            old = before.get(metric)
+            line = f"  {metric:<15} {value if value is not None else '-':>14}"
+            if value is not None and old:
+                change = (value - old) / old
+                line += f"  (was {old}, {change:+.1%})"
+                if change > thresholds[metric]:
+                    line += f"  REGRESSION > {thresholds[metric]:.0%}"
+                    regressions += 1
+            print(line)
+    return regressions
+
+
+def parse_bench_thresholds(overrides: List[str]) -> Dict[str, float]:
+    """Apply `metric=ratio` overrides to the default regression thresholds."""
+    thresholds = dict(BENCH_THRESHOLDS)
+    for override in overrides:
+        metric, _, ratio = override.partition("=")
+        if metric not in thresholds:
+            raise ValueError(f"unknown metric {metric!r}, expected one of {sorted(thresholds)}")
+        thresholds[metric] = float(ratio)
+    return thresholds
 
 
 def generate_index(all_notebooks: List[str], output_dir: str) -> None:
@@ -63,35 +748,234 @@ def generate_index(all_notebooks: List[str], output_dir: str) -> None:
         print(f"Error rendering template: {e}")
 
 
+def discover_notebooks(notebook_directories: List, warn: bool = True) -> List[str]:
+    """Find the notebooks under each `marimo/<directory>`."""
+    all_notebooks: List[str] = []
+    for directory in notebook_directories:
+        dir_path = Path('marimo').joinpath(directory)
+        if not dir_path.exists():
+            if warn:
+                print(f"Warning: Directory not found: {dir_path}")
+            continue
+
+        all_notebooks.extend(str(path) for path in dir_path.rglob("*.py"))
+    return all_notebooks
+
+
+def snapshot_watched_files(notebook_directories: List) -> Dict[str, tuple]:
+    """Record (mtime, size) of every file a notebook export depends on.
+
+    That is the notebooks themselves plus everything under each notebook
+    directory's `public/` and `layouts/` folders.
+    """
+    snapshot: Dict[str, tuple] = {}
+    for directory in notebook_directories:
+        dir_path = Path('marimo').joinpath(directory)
+        paths = [
+            *dir_path.rglob("*.py"),
+            *dir_path.joinpath("public").rglob("*"),
+            *dir_path.joinpath("layouts").rglob("*"),
+        ]
+        for path in paths:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if path.is_file():
+                snapshot[str(path)] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def watch_notebooks(
+        notebook_directories: List,
+        output_dir: str,
+        jobs: int,
+        cache_dir: str,
+        optimise: bool = True,
+        poll_interval: float = 0.5,
+        debounce_seconds: float = 1.0,
+) -> int:
+    """Rebuild notebooks whose sources change, until interrupted.
+
+    Changes are collected until no file has changed for `debounce_seconds`,
+    so that a burst of writes (e.g. an editor save plus a CSV refresh)
+    triggers a single rebuild. Only notebooks in a directory with a changed
+    file are re-exported, and index.html is only re-rendered when notebooks
+    are added or removed.
+    """
+    print(f"Watching {', '.join(notebook_directories)} for changes (Ctrl+C to stop)")
+    previous = snapshot_watched_files(notebook_directories)
+    known_notebooks = discover_notebooks(notebook_directories, warn=False)
+    changed_paths: set = set()
+    last_change = 0.0
+
+    try:
+        while True:
+            time.sleep(poll_interval)
+            current = snapshot_watched_files(notebook_directories)
+            changed = {
+                path
+                for path in previous.keys() | current.keys()
+                if previous.get(path) != current.get(path)
+            }
+            previous = current
+            if changed:
+                changed_paths |= changed
+                last_change = time.monotonic()
+                continue
+            if not changed_paths or time.monotonic() - last_change < debounce_seconds:
+                continue
+
+            notebooks = discover_notebooks(notebook_directories, warn=False)
+            changed_dirs = {str(Path(path).parent) for path in changed_paths} | {
+                str(Path(path).parent.parent) for path in changed_paths
+            }
+            affected = [nb for nb in notebooks if str(Path(nb).parent) in changed_dirs]
+            changed_paths = set()
+
+            if affected:
+                print_export_summary(
+                    build_notebooks(affected, output_dir, jobs, cache_dir)
+                )
+            if sorted(notebooks) != sorted(known_notebooks):
+                generate_index(notebooks, output_dir)
+                known_notebooks = notebooks
+            if optimise:
+                print_size_report(optimise_site(output_dir, cache_dir))
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    return 0
+
+
 def main(
         notebook_directories: List
-) -> None:
+) -> int:
     parser = argparse.ArgumentParser(description="Build marimo notebooks")
     parser.add_argument(
         "--output-dir", default="_site", help="Output directory for built files"
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of notebooks to export concurrently (default: CPU count)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Directory of the build cache (default: .build_cache next to the output directory)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Ignore the build cache and re-export every notebook",
+    )
+    parser.add_argument(
+        "--precompute",
+        action="store_true",
+        help="Run the precompute_* cells of notebooks headlessly before exporting",
+    )
+    parser.add_argument(
+        "--no-optimise",
+        action="store_true",
+        help=(
+            "Skip asset deduplication and precompression of the output; they "
+            "only help servers that serve precompressed siblings, not GitHub Pages"
+        ),
+    )
+    parser.add_argument(
+        "--bench",
+        action="store_true",
+        help=(
+            "Export every notebook one at a time, bypassing the cache, and "
+            "record export time, peak RSS, HTML size and asset bytes per notebook"
+        ),
+    )
+    parser.add_argument(
+        "--bench-history",
+        default=None,
+        help="JSON-lines benchmark history (default: bench_history.jsonl next to the output directory)",
+    )
+    parser.add_argument(
+        "--bench-threshold",
+        action="append",
+        default=[],
+        metavar="METRIC=RATIO",
+        help=(
+            "Relative increase over the previous run reported as a regression, "
+            f"e.g. export_seconds=0.5 (defaults: {BENCH_THRESHOLDS})"
+        ),
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help=(
+            "After building, keep rebuilding notebooks whose files change; "
+            "exits non-zero if the first build failed or regressed"
+        ),
+    )
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    try:
+        bench_thresholds = parse_bench_thresholds(args.bench_threshold)
+    except ValueError as e:
+        parser.error(f"--bench-threshold: {e}")
 
-    all_notebooks: List[str] = []
-    for directory in notebook_directories:
-        dir_path = Path('marimo').joinpath(directory)
-        if not dir_path.exists():
-            print(f"Warning: Directory not found: {dir_path}")
-            continue
-
-        all_notebooks.extend(str(path) for path in dir_path.rglob("*.py"))
+    all_notebooks = discover_notebooks(notebook_directories)
 
     if not all_notebooks:
         print("No notebooks found!")
-        return
+        return 0
 
-    # Export notebooks sequentially
-    for nb in all_notebooks:
-        export_html_wasm_as_app(nb, args.output_dir)
+    cache_dir = args.cache_dir or os.path.join(
+        os.path.dirname(os.path.abspath(args.output_dir)), ".build_cache"
+    )
+
+    if args.precompute and not precompute_notebooks(all_notebooks):
+        return 1
+    if not args.precompute:
+        warn_missing_precomputed(all_notebooks)
+
+    # Export changed notebooks concurrently, copy the rest from the cache.
+    # Benchmarks export every notebook, one at a time, so timings are comparable.
+    results = build_notebooks(
+        all_notebooks,
+        args.output_dir,
+        1 if args.bench else args.jobs,
+        cache_dir,
+        force=args.force or args.bench,
+    )
+    print_export_summary(results)
+
+    regressions = 0
+    if args.bench:
+        history_path = args.bench_history or os.path.join(
+            os.path.dirname(os.path.abspath(args.output_dir)), "bench_history.jsonl"
+        )
+        previous = load_previous_benchmark(history_path)
+        current = record_benchmark(results, args.output_dir, history_path)
+        regressions = print_benchmark_diff(previous, current, bench_thresholds)
 
     # Generate index only if all exports succeeded
     generate_index(all_notebooks, args.output_dir)
 
+    if not args.no_optimise:
+        print_size_report(optimise_site(args.output_dir, cache_dir))
+
+    status = 0 if all(r.succeeded for r in results) and not regressions else 1
+    if args.watch:
+        # Rebuilds while watching do not clear a failed or regressed first build
+        return watch_notebooks(
+            notebook_directories,
+            args.output_dir,
+            args.jobs,
+            cache_dir,
+            optimise=not args.no_optimise,
+        ) or status
+
+    return status
+
 
 if __name__ == "__main__":
     notebook_directories = [
@@ -99,4 +983,4 @@ if __name__ == "__main__":
         'ccass_correlation',
         'network_contagion_impact_on_employee_turnover'
     ]
-    main(notebook_directories)
\ No newline at end of file
+    sys.exit(main(notebook_directories))
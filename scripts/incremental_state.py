@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+"""Keep the network-contagion notebook's snapshot and features up to date.
+
+Each month a fresh SFC licence register is scraped. Instead of rebuilding
+every snapshot month from 2003, this script refreshes a state directory:
+
+- the encoded employment history (`stints.parquet`) and the stable id
+  lookups of its int32 codes (`lookups/`)
+- the co-employment and mobility peer graphs (`peer_graphs/`)
+- two Parquet tables partitioned by `snapshot_month=YYYY-MM`: the snapshot
+  rows (`snapshot/`) and the company-level peer departure percentages of
+  every lookback window (`features/`)
+
+A refresh diffs the new employment history against the stored one,
+patches only the snapshot months whose rows changed, appends the new
+months, and recomputes the features of the affected company-months: those
+whose staff changed, and the same companies x months later. The peer
+graphs are patched for the professionals whose stints changed, then
+advanced by the new months. An interrupted refresh, or one that asks for
+other windows or an earlier month, rebuilds the state.
+
+Run it where the register is. `read_incremental_features` and
+`read_peer_graphs` read the state back.
+
+Usage: python scripts/incremental_state.py <state dir> [--through-month YYYY-MM]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+from pathlib import Path
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from sfc_notebook import run_notebook
+
+INCREMENTAL_STATE_FORMAT = 2
+STINT_COLUMNS = ["companyId", "professionalId", "effectiveDate", "endDate"]
+SNAPSHOT_COLUMNS = ["companyId", "professionalId", "left_next_month"]
+STATE_DTYPES = {
+    "companyId": np.int32,
+    "professionalId": np.int32,
+    "left_next_month": np.int8,
+}
+
+
+def _month_index(month) -> int:
+    return int(np.datetime64(month, "M").astype(np.int64))
+
+
+def _year(month) -> int:
+    return int(np.datetime64(int(month), "M").astype("datetime64[Y]").astype(np.int64)) + 1970
+
+
+def _read_lookups(state_dir) -> Dict[str, pd.Index]:
+    return {
+        column: pd.Index(
+            pd.read_parquet(Path(state_dir) / "lookups" / f"{column}.parquet")["id"]
+        )
+        for column in ("companyId", "professionalId")
+    }
+
+
+def _partition_path(state_dir, table: str, month) -> Path:
+    return (
+        Path(state_dir)
+        / table
+        / f"snapshot_month={np.datetime64(int(month), 'M')}"
+        / "part-0.parquet"
+    )
+
+
+def read_month_partitions(
+    state_dir, table: str, months: Iterable[int], companies=None
+) -> Optional[pd.DataFrame]:
+    """Read the partitions of `months` of a state table, or None if none exist.
+
+    Only the rows of `companies` are kept when given. snapshot_month is
+    returned as an int16 month index.
+    """
+    frames = []
+    for month in sorted(set(months)):
+        path = _partition_path(state_dir, table, month)
+        if not path.exists():
+            continue
+        part = pd.read_parquet(path)
+        if companies is not None:
+            part = part[part["companyId"].isin(companies)]
+        frames.append(part.assign(snapshot_month=np.int16(month)))
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True)
+
+
+def write_month_partitions(
+    state_dir, table: str, df: pd.DataFrame, sort_by, months: Iterable[int] = ()
+) -> None:
+    """Write one partition per month of `df`.
+
+    The other `months` are left without rows, so their partitions are
+    removed.
+    """
+    for month, part in df.groupby("snapshot_month", sort=True):
+        path = _partition_path(state_dir, table, month)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        part = (
+            part.drop(columns="snapshot_month")
+            .astype({c: t for c, t in STATE_DTYPES.items() if c in part})
+            .sort_values(sort_by, ignore_index=True)
+        )
+        part.to_parquet(f"{path}.tmp", compression="zstd", index=False)
+        os.replace(f"{path}.tmp", path)
+    for month in set(months) - set(df["snapshot_month"]):
+        _partition_path(state_dir, table, month).unlink(missing_ok=True)
+
+
+def snapshot_rows(
+    notebook: Mapping[str, Any], stints: pd.DataFrame, from_month: int, to_month: int
+) -> pd.DataFrame:
+    """Snapshot rows of `stints` for the months `from_month` to `to_month`.
+
+    The rows carry left_next_month in place of endDate.
+    """
+    if to_month < from_month or stints.empty:
+        return pd.DataFrame(
+            {
+                "snapshot_month": pd.Series(dtype=np.int16),
+                "companyId": pd.Series(dtype=np.int32),
+                "professionalId": pd.Series(dtype=np.int32),
+                "left_next_month": pd.Series(dtype=np.int8),
+            }
+        )
+    # The snapshot covers whole years, up to January of `to_year`
+    rows = notebook["add_left_next_momth"](
+        notebook["generate_monthly_active_sfc_professional_snapshot"](
+            stints, from_year=_year(from_month), to_year=_year(to_month) + 1
+        )
+    )
+    in_range = rows["snapshot_month"].between(from_month, to_month)
+    return rows.loc[in_range, ["snapshot_month", *SNAPSHOT_COLUMNS]]
+
+
+def company_month_features(
+    notebook: Mapping[str, Any], snapshot: pd.DataFrame, lookback_months_list
+) -> pd.DataFrame:
+    """Peer departure percentage of every lookback window.
+
+    There is one row per company and month with staff in `snapshot`.
+    """
+    rows = snapshot[snapshot["companyId"] >= 0]
+    pairs = rows[["snapshot_month", "companyId"]].drop_duplicates()
+    if rows.empty:
+        return pairs.assign(
+            **{f"pct_departed_staff_{x}m": np.float32() for x in lookback_months_list}
+        )
+    first_month, counts = notebook["count_peer_departures"](
+        rows["snapshot_month"].to_numpy(dtype=np.int64),
+        rows["companyId"].to_numpy(dtype=np.int64),
+        rows["professionalId"].to_numpy(dtype=np.int64) + 1,
+        lookback_months_list,
+    )
+    company = pairs["companyId"].to_numpy()
+    month_offset = pairs["snapshot_month"].to_numpy(dtype=np.int64) - first_month
+    return pairs.assign(
+        **{
+            f"pct_departed_staff_{x}m": notebook["departure_pct"](*counts[x])[
+                company, month_offset
+            ].astype(np.float32)
+            for x in lookback_months_list
+        }
+    )
+
+
+def diff_stints(
+    previous: pd.DataFrame, current: pd.DataFrame
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Stints only in `previous` (removed) and only in `current` (added).
+
+    Duplicate stints are counted.
+    """
+    weights = (
+        pd.concat(
+            [
+                previous[STINT_COLUMNS].assign(weight=-1),
+                current[STINT_COLUMNS].assign(weight=1),
+            ],
+            ignore_index=True,
+        )
+        .groupby(STINT_COLUMNS, dropna=False)["weight"]
+        .sum()
+        .reset_index()
+    )
+
+    def _expand(changed):
+        return changed.loc[changed.index.repeat(changed["weight"].abs())][
+            STINT_COLUMNS
+        ].reset_index(drop=True)
+
+    return _expand(weights[weights["weight"] < 0]), _expand(
+        weights[weights["weight"] > 0]
+    )
+
+
+def _write_state(notebook, state_dir, meta, stints, lookups, peer_graphs) -> None:
+    notebook["save_peer_graphs"](peer_graphs, state_dir / "peer_graphs")
+    for column, lookup in lookups.items():
+        pd.DataFrame({"id": lookup}).to_parquet(
+            state_dir / "lookups" / f"{column}.parquet", index=False
+        )
+    stints.to_parquet(state_dir / "stints.parquet", index=False)
+    (state_dir / "meta.json").write_text(json.dumps(meta, indent=2))
+
+
+def refresh_incremental_state(
+    notebook: Mapping[str, Any],
+    history: pd.DataFrame,
+    state_dir,
+    through_month: str,
+    lookback_months_list=range(1, 25),
+    from_year: int = 2003,
+) -> Dict[str, Any]:
+    """Bring the state in `state_dir` up to `through_month` ("YYYY-MM").
+
+    `history` is the notebook's employment history, and `notebook` maps
+    the names of the notebook's snapshot, feature and peer graph functions
+    to them. The state is rebuilt from scratch when there is no usable one.
+
+    Returns:
+        Dict[str, Any]: a summary of what was rewritten
+    """
+    started = time.perf_counter()
+    state_dir = Path(state_dir)
+    lookback_months_list = sorted(int(x) for x in lookback_months_list)
+    from_month = _month_index(f"{from_year}-01")
+    to_month = _month_index(through_month)
+
+    meta_path = state_dir / "meta.json"
+    meta = json.loads(meta_path.read_text()) if meta_path.exists() else None
+    # An interrupted refresh leaves partitions half patched, so rebuild
+    rebuild = (
+        meta is None
+        or meta["format"] != INCREMENTAL_STATE_FORMAT
+        or meta["in_progress"]
+        or meta["from_month"] != str(np.datetime64(from_month, "M"))
+        or meta["lookback_months"] != lookback_months_list
+        or _month_index(meta["through_month"]) > to_month
+    )
+
+    lookups = None if rebuild else _read_lookups(state_dir)
+    stints, lookups = notebook["encode_sfc_ids"](history[STINT_COLUMNS], lookups=lookups)
+    stints = stints.astype(
+        {"effectiveDate": "datetime64[ms]", "endDate": "datetime64[ms]"}
+    )
+
+    new_meta = {
+        "format": INCREMENTAL_STATE_FORMAT,
+        "from_month": str(np.datetime64(from_month, "M")),
+        "through_month": str(np.datetime64(to_month, "M")),
+        "lookback_months": lookback_months_list,
+        "in_progress": True,
+    }
+
+    if rebuild:
+        shutil.rmtree(state_dir, ignore_errors=True)
+        (state_dir / "lookups").mkdir(parents=True)
+        meta_path.write_text(json.dumps(new_meta, indent=2))
+
+        snapshot = snapshot_rows(notebook, stints, from_month, to_month)
+        write_month_partitions(state_dir, "snapshot", snapshot, SNAPSHOT_COLUMNS)
+        features = company_month_features(notebook, snapshot, lookback_months_list)
+        write_month_partitions(state_dir, "features", features, ["companyId"])
+
+        peer_graphs = notebook["advance_peer_graphs"](None, stints, to_month)
+
+        summary = {
+            "mode": "rebuild",
+            "snapshot_months_written": snapshot["snapshot_month"].nunique(),
+            "company_months_recomputed": len(features),
+        }
+    else:
+        previous_month = _month_index(meta["through_month"])
+        meta_path.write_text(json.dumps({**meta, "in_progress": True}, indent=2))
+
+        # 1. Rows of the changed stints in the months already processed;
+        # rows a removed and an added stint share cancel out
+        previous_stints = pd.read_parquet(state_dir / "stints.parquet")
+        removed, added = diff_stints(previous_stints, stints)
+        delta_key = ["snapshot_month", *SNAPSHOT_COLUMNS]
+        delta = (
+            pd.concat(
+                [
+                    snapshot_rows(notebook, removed, from_month, previous_month).assign(
+                        weight=-1
+                    ),
+                    snapshot_rows(notebook, added, from_month, previous_month).assign(
+                        weight=1
+                    ),
+                ],
+                ignore_index=True,
+            )
+            .groupby(delta_key)["weight"]
+            .sum()
+            .reset_index()
+        )
+        delta = delta[delta["weight"] != 0]
+
+        # 2. Patch the snapshot months with changed rows, append new months
+        patched = []
+        for month, month_delta in delta.groupby("snapshot_month"):
+            part = read_month_partitions(state_dir, "snapshot", [month])
+            counts = (
+                pd.concat(
+                    [
+                        part.assign(weight=1) if part is not None else None,
+                        month_delta,
+                    ]
+                )
+                .groupby(delta_key)["weight"]
+                .sum()
+            )
+            counts = counts[counts > 0]
+            patched.append(
+                counts.index.repeat(counts.to_numpy()).to_frame(index=False)
+            )
+        new_months = snapshot_rows(notebook, stints, previous_month + 1, to_month)
+        changed_snapshot = pd.concat(patched + [new_months], ignore_index=True)
+        write_month_partitions(
+            state_dir,
+            "snapshot",
+            changed_snapshot,
+            SNAPSHOT_COLUMNS,
+            months=delta["snapshot_month"].unique(),
+        )
+
+        # 3. Company-months whose staff changed, and the same companies x
+        # months later, as the past cohort of a lookback window
+        presence = (
+            delta.groupby(["snapshot_month", "companyId", "professionalId"])[
+                "weight"
+            ]
+            .sum()
+            .reset_index()
+        )
+        changed_pairs = presence.loc[
+            presence["weight"] != 0, ["snapshot_month", "companyId"]
+        ].drop_duplicates()
+        affected = pd.concat(
+            [
+                changed_pairs.assign(
+                    snapshot_month=changed_pairs["snapshot_month"] + x
+                )
+                for x in [0, *lookback_months_list]
+            ]
+            + [new_months[["snapshot_month", "companyId"]]],
+            ignore_index=True,
+        )
+        affected = affected[
+            affected["snapshot_month"].between(from_month, to_month)
+            & (affected["companyId"] >= 0)
+        ].drop_duplicates()
+
+        company_months_recomputed = 0
+        if not affected.empty:
+            affected_months = affected["snapshot_month"].unique()
+            cohort_months = {
+                int(month) - x
+                for month in affected_months
+                for x in [0, *lookback_months_list]
+            }
+            snapshot = read_month_partitions(
+                state_dir,
+                "snapshot",
+                cohort_months,
+                companies=affected["companyId"].unique(),
+            )
+            features = company_month_features(
+                notebook, snapshot, lookback_months_list
+            ).merge(affected, on=["snapshot_month", "companyId"])
+
+            company_months_recomputed = len(features)
+
+            # Replace the affected companies' rows month by month; those
+            # left without staff have no features anymore
+            patched = [features]
+            for month, month_affected in affected.groupby("snapshot_month"):
+                part = read_month_partitions(state_dir, "features", [month])
+                if part is not None:
+                    patched.append(
+                        part[~part["companyId"].isin(month_affected["companyId"])]
+                    )
+            write_month_partitions(
+                state_dir,
+                "features",
+                pd.concat(patched, ignore_index=True),
+                ["companyId"],
+                months=affected_months,
+            )
+
+        # 4. Peer graphs: the professionals whose stints changed are
+        # regraphed up to the previous month, then the new months added
+        changed_professionals = pd.concat([removed, added])["professionalId"].unique()
+        peer_graphs = notebook["advance_peer_graphs"](
+            notebook["patch_peer_graphs"](
+                read_peer_graphs(notebook, state_dir),
+                previous_stints,
+                stints,
+                changed_professionals,
+            ),
+            stints,
+            to_month,
+        )
+
+        summary = {
+            "mode": "incremental",
+            "stints_removed": len(removed),
+            "stints_added": len(added),
+            "professionals_regraphed": len(changed_professionals),
+            "snapshot_months_written": changed_snapshot["snapshot_month"].nunique(),
+            "company_months_recomputed": company_months_recomputed,
+        }
+
+    _write_state(
+        notebook,
+        state_dir,
+        {**new_meta, "in_progress": False},
+        stints,
+        lookups,
+        peer_graphs,
+    )
+    summary["through_month"] = new_meta["through_month"]
+    summary["seconds"] = round(time.perf_counter() - started, 2)
+    return summary
+
+
+def read_incremental_features(
+    state_dir, from_month: str, to_month: str
+) -> Tuple[pd.DataFrame, Dict[str, pd.Index]]:
+    """Row-level features of the months `from_month` to `to_month` ("YYYY-MM").
+
+    Returns the encoded snapshot rows of the state, with one
+    `pct_departed_staff_<x>m` column per window, and the id lookups.
+    """
+    state_dir = Path(state_dir)
+    months = range(_month_index(from_month), _month_index(to_month) + 1)
+    snapshot = read_month_partitions(state_dir, "snapshot", months)
+    features = read_month_partitions(state_dir, "features", months)
+    return (
+        snapshot.merge(features, on=["snapshot_month", "companyId"], how="left"),
+        _read_lookups(state_dir),
+    )
+
+
+def read_peer_graphs(notebook: Mapping[str, Any], state_dir) -> Dict[str, Any]:
+    """The peer graphs of the state, up to its through_month."""
+    state_dir = Path(state_dir)
+    meta = json.loads((state_dir / "meta.json").read_text())
+    return notebook["load_peer_graphs"](
+        state_dir / "peer_graphs", _month_index(meta["through_month"])
+    )
+
+
+def main(state_dir: str, through_month: str) -> int:
+    with run_notebook() as notebook:
+        history = notebook["sfc_professional_company_employment_history"]
+        if not isinstance(history, pd.DataFrame):
+            # The notebook may hold it as a polars DataFrame
+            history = history.to_pandas()
+        print(refresh_incremental_state(notebook, history, state_dir, through_month))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Refresh the partitioned snapshot, features and peer graphs "
+        "of the network-contagion notebook"
+    )
+    parser.add_argument("state_dir", help="State directory, created on first run")
+    parser.add_argument(
+        "--through-month",
+        default=str(np.datetime64("today", "M")),
+        help="Last snapshot month to process, as YYYY-MM (default: this month)",
+    )
+    args = parser.parse_args()
+    sys.exit(main(args.state_dir, args.through_month))
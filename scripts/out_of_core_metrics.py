@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""Stream the network-contagion notebook's turnover metrics out of core.
+
+The full 2003-2026 snapshot, and its feature columns, do not fit in memory
+on a small machine. This script runs snapshot -> left_next_month ->
+lookback features -> turnover metrics a chunk of months at a time instead.
+
+Each chunk's snapshot rows are spilled to Parquet partitions by
+snapshot_month, and the lookback windows read the months before the chunk
+back from the spill. The metrics of every month are final once its chunk is
+done, so only the per-month metrics, written to `<spill dir>/metrics.parquet`,
+are ever held for the whole range. `--n-jobs N` (-1 for every core) counts
+the peer departures in N worker processes.
+
+Run it where the register is.
+
+Usage: python scripts/out_of_core_metrics.py <spill dir> [--from-year 2003] [--to-year 2026] [--n-jobs N]
+"""
+
+import sys
+import time
+import argparse
+from typing import Any, Mapping
+
+import numpy as np
+import pandas as pd
+
+from incremental_state import (
+    SNAPSHOT_COLUMNS,
+    read_month_partitions,
+    snapshot_rows,
+    write_month_partitions,
+)
+from sfc_notebook import run_notebook
+
+
+def stream_turnover_metrics(
+    notebook: Mapping[str, Any],
+    stints: pd.DataFrame,
+    spill_dir,
+    lookback_months_list=(3, 6, 12),
+    from_year: int = 2003,
+    to_year: int = 2026,
+    chunk_months: int = 12,
+    n_jobs: int = 1,
+) -> pd.DataFrame:
+    """The notebook's turnover metrics for Jan `from_year` to Jan `to_year`.
+
+    The result equals the notebook's
+    past_staff_departure_vs_next_month_departure_metrics, computed
+    `chunk_months` months at a time. `stints` is the encoded employment
+    history, and `notebook` maps the names of the notebook's snapshot and
+    feature functions to them.
+
+    The snapshot rows of each chunk are spilled to `<spill_dir>/snapshot/`,
+    and the months a lookback window reaches back to are read from there,
+    so peak memory is one chunk plus max(lookback_months_list) months of
+    rows. The metrics are accumulated per month as sums and counts, so each
+    chunk is dropped once done. `n_jobs` is passed on to
+    create_multi_lookback_features.
+    """
+    lookback_months_list = sorted(int(x) for x in lookback_months_list)
+    halo = max(lookback_months_list)
+    from_month = int(np.datetime64(f"{from_year}-01", "M").astype(np.int64))
+    to_month = int(np.datetime64(f"{to_year}-01", "M").astype(np.int64))
+
+    effective = stints["effectiveDate"].to_numpy(dtype="datetime64[M]").astype(np.int64)
+    end = stints["endDate"].to_numpy(dtype="datetime64[M]").astype(np.int64)
+    still_active = np.isnat(stints["endDate"].to_numpy(dtype="datetime64[M]"))
+
+    n_months = to_month - from_month + 1
+    pct_departed_staff_sum = {x: np.zeros(n_months) for x in lookback_months_list}
+    left_next_month_sum = {x: np.zeros(n_months) for x in lookback_months_list}
+    rows_with_history = {x: np.zeros(n_months) for x in lookback_months_list}
+
+    for first in range(from_month, to_month + 1, chunk_months):
+        last = min(first + chunk_months - 1, to_month)
+        # Only the stints active in the chunk have rows in it
+        in_chunk = (effective <= last) & (still_active | (end >= first))
+        rows = snapshot_rows(notebook, stints[in_chunk], first, last)
+        write_month_partitions(
+            spill_dir, "snapshot", rows, SNAPSHOT_COLUMNS, months=range(first, last + 1)
+        )
+        halo_rows = read_month_partitions(
+            spill_dir, "snapshot", range(max(from_month, first - halo), first)
+        )
+        n_halo_rows = 0 if halo_rows is None else len(halo_rows)
+        features = notebook["create_multi_lookback_features"](
+            pd.concat([halo_rows, rows], ignore_index=True),
+            lookback_months_list,
+            n_jobs=n_jobs,
+        ).iloc[n_halo_rows:]
+
+        month = features["snapshot_month"].to_numpy(dtype=np.int64) - from_month
+        left_next_month = features["left_next_month"].to_numpy(dtype=np.float64)
+        for x in lookback_months_list:
+            pct = features[f"pct_departed_staff_{x}m"].to_numpy(dtype=np.float64)
+            # Rows without enough history for the window are left out
+            has_history = ~np.isnan(pct)
+            pct_departed_staff_sum[x] += np.bincount(
+                month[has_history], weights=pct[has_history], minlength=n_months
+            )
+            left_next_month_sum[x] += np.bincount(
+                month[has_history],
+                weights=left_next_month[has_history],
+                minlength=n_months,
+            )
+            rows_with_history[x] += np.bincount(
+                month[has_history], minlength=n_months
+            )
+        del rows, halo_rows, features
+
+    metrics = []
+    for x in lookback_months_list:
+        months = np.flatnonzero(rows_with_history[x])
+        metrics.append(
+            pd.DataFrame(
+                {
+                    "lookback_period": f"{x} Months",
+                    "snapshot_month": notebook["decode_months"](months + from_month),
+                    "pct_departed_staff": pct_departed_staff_sum[x][months]
+                    / rows_with_history[x][months],
+                    "avg_left_next_month": left_next_month_sum[x][months]
+                    / rows_with_history[x][months],
+                }
+            )
+        )
+    metrics = pd.concat(metrics, ignore_index=True).sort_values(
+        ["lookback_period", "snapshot_month"], ignore_index=True
+    )
+    return metrics
+
+
+def main(spill_dir: str, from_year: int, to_year: int, n_jobs: int) -> int:
+    with run_notebook() as notebook:
+        started = time.perf_counter()
+        metrics = stream_turnover_metrics(
+            notebook,
+            notebook["encoded_sfc_professional_company_employment_history"],
+            spill_dir,
+            from_year=from_year,
+            to_year=to_year,
+            n_jobs=n_jobs,
+        )
+    metrics.to_parquet(f"{spill_dir}/metrics.parquet", index=False)
+    print(
+        {
+            "metrics_rows": len(metrics),
+            "seconds": round(time.perf_counter() - started, 2),
+        }
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compute the turnover metrics of the network-contagion "
+        "notebook a chunk of months at a time"
+    )
+    parser.add_argument("spill_dir", help="Directory for the spilled snapshot and metrics.parquet")
+    parser.add_argument("--from-year", type=int, default=2003, help="First snapshot year (default: 2003)")
+    parser.add_argument("--to-year", type=int, default=2026, help="Last snapshot year (default: 2026)")
+    parser.add_argument(
+        "--n-jobs",
+        type=int,
+        default=1,
+        help="Processes counting peer departures; -1 uses every core (default: 1)",
+    )
+    args = parser.parse_args()
+    sys.exit(main(args.spill_dir, args.from_year, args.to_year, args.n_jobs))
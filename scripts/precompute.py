@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Execute a marimo notebook headlessly and store its precomputed cells.
+
+Cells named `precompute_<something>` hold computations that are too heavy
+for the browser. They stop unless MARIMO_PRECOMPUTE=1 is set, and the
+cells that display their results read the stored artifacts instead. This
+script runs the notebook with that variable set, then serialises every
+variable those cells return into the notebook's `public/precomputed/` folder:
+
+- pandas and polars DataFrames as `<name>.parquet`
+- altair charts as `<name>.vl.json` Vega-Lite specs
+
+The inputs of these cells, such as the SFC register, are not in the
+repository, so CI cannot precompute. Run this script (or
+`scripts/build.py --precompute`) where the inputs are, and commit the
+`public/precomputed/` folder; the deployed site is built from it.
+
+Usage: python scripts/precompute.py marimo/<dir>/<notebook>.py
+"""
+
+import os
+import ast
+import sys
+import importlib.util
+from pathlib import Path
+from typing import Dict, List
+
+PRECOMPUTE_PREFIX = "precompute_"
+PRECOMPUTE_ENV_VAR = "MARIMO_PRECOMPUTE"
+
+
+def _is_app_cell_decorator(decorator: ast.expr) -> bool:
+    """Match `@app.cell` and `@app.cell(...)`."""
+    if isinstance(decorator, ast.Call):
+        decorator = decorator.func
+    return (
+        isinstance(decorator, ast.Attribute)
+        and decorator.attr == "cell"
+        and isinstance(decorator.value, ast.Name)
+        and decorator.value.id == "app"
+    )
+
+
+def find_precompute_cells(notebook_path: str) -> Dict[str, List[str]]:
+    """Map each `precompute_*` cell of a notebook to the names it returns."""
+    tree = ast.parse(Path(notebook_path).read_text(encoding="utf-8"))
+    cells: Dict[str, List[str]] = {}
+    for node in tree.body:
+        if not isinstance(node, ast.FunctionDef):
+            continue
+        if not node.name.startswith(PRECOMPUTE_PREFIX):
+            continue
+        if not any(_is_app_cell_decorator(d) for d in node.decorator_list):
+            continue
+
+        names: List[str] = []
+        last = node.body[-1]
+        if isinstance(last, ast.Return) and last.value is not None:
+            values = last.value.elts if isinstance(last.value, ast.Tuple) else [last.value]
+            names = [v.id for v in values if isinstance(v, ast.Name)]
+        cells[node.name] = names
+    return cells
+
+
+def has_precompute_cells(notebook_path: str) -> bool:
+    """Whether a notebook has any cell to precompute at build time."""
+    return bool(find_precompute_cells(notebook_path))
+
+
+def missing_artifacts(notebook_path: str) -> List[str]:
+    """Names returned by a notebook's precompute cells that have no artifact yet."""
+    output_dir = Path(notebook_path).parent / "public" / "precomputed"
+    return [
+        name
+        for names in find_precompute_cells(notebook_path).values()
+        for name in names
+        if not any(
+            (output_dir / f"{name}{suffix}").exists()
+            for suffix in (".parquet", ".vl.json")
+        )
+    ]
+
+
+def serialise(name: str, value: object, output_dir: Path) -> Path:
+    """Write one precomputed value; raise TypeError for unsupported types."""
+    module = type(value).__module__.split(".")[0]
+    if module == "pandas" and hasattr(value, "to_parquet"):
+        path = output_dir / f"{name}.parquet"
+        value.to_parquet(path, compression="zstd", index=False)
+    elif module == "polars" and hasattr(value, "write_parquet"):
+        path = output_dir / f"{name}.parquet"
+        value.write_parquet(path, compression="zstd")
+    elif module == "altair" and hasattr(value, "to_json"):
+        path = output_dir / f"{name}.vl.json"
+        path.write_text(value.to_json(), encoding="utf-8")
+    else:
+        raise TypeError(
+            f"Cannot precompute {name!r} of type {type(value).__name__}; "
+            "return DataFrames or altair charts from precompute cells"
+        )
+    return path
+
+
+def precompute_notebook(notebook_path: str) -> int:
+    """Run the notebook and write its precomputed artifacts.
+
+    Returns:
+        int: process exit code
+    """
+    cells = find_precompute_cells(notebook_path)
+    if not cells:
+        print(f"No {PRECOMPUTE_PREFIX}* cells in {notebook_path}")
+        return 0
+
+    os.environ[PRECOMPUTE_ENV_VAR] = "1"
+    spec = importlib.util.spec_from_file_location(Path(notebook_path).stem, notebook_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    _, defs = module.app.run()
+
+    output_dir = Path(notebook_path).parent / "public" / "precomputed"
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    exit_code = 0
+    for cell_name, names in cells.items():
+        for name in names:
+            if defs.get(name) is None:
+                print(f"Error: {cell_name} did not compute {name}")
+                exit_code = 1
+                continue
+            try:
+                path = serialise(name, defs[name], output_dir)
+            except TypeError as e:
+                print(f"Error: {e}")
+                exit_code = 1
+                continue
+            print(f"Precomputed {name} to {path} ({path.stat().st_size:,} bytes)")
+    return exit_code
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(2)
+    sys.exit(precompute_notebook(sys.argv[1]))
@@ -0,0 +1,55 @@
+"""Run the network-contagion notebook headlessly for the batch scripts.
+
+The batch scripts next to this module need the employment history that the
+notebook builds from the SFC licence register, and the notebook's snapshot,
+feature and peer graph functions. Their engines take those functions as a
+mapping of the notebook's definitions: `run_notebook()` from a script, or
+the cell's own inputs from the notebook. The scripts only need the
+employment history, so `run_notebook()` sets SFC_OUT_OF_CORE=1, which stops
+the notebook's cells holding the in-memory snapshot and its derivatives.
+
+Run the scripts where the register is, as for `precompute.py`.
+"""
+
+import os
+import sys
+import types
+import contextlib
+import importlib.util
+from pathlib import Path
+from typing import Any, Iterator, Mapping
+
+NOTEBOOK_PATH = (
+    Path(__file__).resolve().parent.parent
+    / "marimo"
+    / "network_contagion_impact_on_employee_turnover"
+    / "network_contagion_impact_on_employee_turnover.py"
+)
+OUT_OF_CORE_ENV_VAR = "SFC_OUT_OF_CORE"
+
+
+@contextlib.contextmanager
+def run_notebook() -> Iterator[Mapping[str, Any]]:
+    """Run the notebook and yield its definitions.
+
+    marimo runs a notebook in a `__main__` module of its own, and the
+    notebook's worker processes look its functions up there. That module is
+    put back in place until the block exits, so the engines can start
+    workers too.
+    """
+    os.environ[OUT_OF_CORE_ENV_VAR] = "1"
+    spec = importlib.util.spec_from_file_location(NOTEBOOK_PATH.stem, NOTEBOOK_PATH)
+    notebook = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(notebook)
+    _, defs = notebook.app.run()
+
+    main = types.ModuleType("__main__")
+    main.__dict__.update(defs)
+    # Spawned workers start by running this file, as they do in a notebook run
+    main.__file__ = str(NOTEBOOK_PATH)
+    previous_main = sys.modules["__main__"]
+    sys.modules["__main__"] = main
+    try:
+        yield defs
+    finally:
+        sys.modules["__main__"] = previous_main
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""Train the network-contagion notebook's turnover prediction models.
+
+A logistic regression and a gradient boosting model predict whether a
+professional leaves next month from the peer departure percentages of the
+3, 6 and 12-month windows, the professional's tenure in months and the
+company's headcount.
+
+The feature matrix is built once per employment history, year range and
+window set, a year at a time, and memory-mapped from the notebook's cache
+directory, so the cross-validation workers share it instead of copying it.
+Each of the last years is scored on a model trained on the months before
+it, leaving out the month just before, whose labels come from the test
+year. The report gives the ROC AUC of every fold, with the fit time
+and the peak memory of the run.
+
+Run it where the register is, e.g. monthly; the notebook's "Train" button
+runs the same on the selected year range.
+
+Usage: python scripts/turnover_models.py [--from-year 2003] [--to-year 2026] [--n-jobs N]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+from typing import Any, List, Mapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import cross_validate
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+from sfc_notebook import run_notebook
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+
+def turnover_feature_columns(lookback_months_list) -> List[str]:
+    return [f"pct_departed_staff_{x}m" for x in lookback_months_list] + [
+        "tenure_months",
+        "company_size",
+    ]
+
+
+def build_turnover_feature_matrix(
+    notebook: Mapping[str, Any],
+    stints: pd.DataFrame,
+    matrix_dir: str,
+    lookback_months_list,
+    from_year: int,
+    to_year: int,
+    n_jobs: int = 1,
+) -> None:
+    """Write the training rows of Jan `from_year` to Jan `to_year` to `matrix_dir`.
+
+    The rows are written a year at a time, in month order: features.f32
+    (one float32 row of turnover_feature_columns per professional-month),
+    labels.i8 (left_next_month) and months.i16 (snapshot_month). Rows
+    without a company, or without enough history for every window, are
+    left out.
+    """
+    lookback_months_list = sorted(int(x) for x in lookback_months_list)
+    halo_years = -(-max(lookback_months_list) // 12)
+    columns = turnover_feature_columns(lookback_months_list)
+    to_month = int(np.datetime64(f"{to_year}-01", "M").astype(np.int64))
+
+    building = f"{matrix_dir}.tmp"
+    os.makedirs(building, exist_ok=True)
+    n_rows = 0
+    with open(os.path.join(building, "features.f32"), "wb") as features_file, open(
+        os.path.join(building, "labels.i8"), "wb"
+    ) as labels_file, open(os.path.join(building, "months.i16"), "wb") as months_file:
+        for year in range(from_year, to_year + 1):
+            first = int(np.datetime64(f"{year}-01", "M").astype(np.int64))
+            last = min(first + 11, to_month)
+            # The rows of the year, and of the months its windows reach back to
+            rows = notebook["add_left_next_momth"](
+                notebook["generate_monthly_active_sfc_professional_snapshot"](
+                    stints,
+                    from_year=max(from_year, year - halo_years),
+                    to_year=year + 1,
+                    with_tenure=True,
+                )
+            )
+            rows = notebook["create_multi_lookback_features"](
+                rows[rows["snapshot_month"] <= last], lookback_months_list, n_jobs=n_jobs
+            )
+            rows = rows[(rows["snapshot_month"] >= first) & (rows["companyId"] >= 0)]
+            rows = rows.assign(
+                company_size=rows.groupby(["snapshot_month", "companyId"])[
+                    "professionalId"
+                ].transform("size")
+            ).dropna(subset=columns)
+
+            rows[columns].to_numpy(dtype=np.float32).tofile(features_file)
+            rows["left_next_month"].to_numpy(dtype=np.int8).tofile(labels_file)
+            rows["snapshot_month"].to_numpy(dtype=np.int16).tofile(months_file)
+            n_rows += len(rows)
+
+    with open(os.path.join(building, "meta.json"), "w") as file:
+        json.dump({"columns": columns, "rows": n_rows}, file)
+    # Left behind by an interrupted build
+    shutil.rmtree(matrix_dir, ignore_errors=True)
+    os.replace(building, matrix_dir)
+
+
+def load_turnover_feature_matrix(
+    notebook: Mapping[str, Any],
+    stints: pd.DataFrame,
+    key,
+    lookback_months_list=(3, 6, 12),
+    from_year: int = 2003,
+    to_year: int = 2026,
+    n_jobs: int = 1,
+    cache_dir: Optional[str] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[str]]:
+    """The matrix of build_turnover_feature_matrix, memory-mapped read-only.
+
+    Returns the features, labels and months, and the feature names. The
+    matrix is built on first use for `key`, which describes the employment
+    history, and is reused from `<cache_dir>/turnover_matrix/` afterwards;
+    `cache_dir` defaults to the notebook's NOTEBOOK_CACHE_DIR. `notebook`
+    maps the names of the notebook's snapshot and feature functions, and
+    of code_fingerprint, to them.
+    """
+    lookback_months_list = sorted(int(x) for x in lookback_months_list)
+    digest = hashlib.sha256(
+        json.dumps(
+            {
+                "key": key,
+                "code": notebook["code_fingerprint"](
+                    build_turnover_feature_matrix,
+                    notebook["stint_month_range"],
+                    notebook["generate_monthly_active_sfc_professional_snapshot"],
+                    notebook["create_multi_lookback_features"],
+                ),
+                "lookback_months": lookback_months_list,
+                "from_year": from_year,
+                "to_year": to_year,
+            },
+            sort_keys=True,
+        ).encode()
+    ).hexdigest()[:24]
+    matrix_dir = os.path.join(
+        cache_dir or notebook["NOTEBOOK_CACHE_DIR"], "turnover_matrix", digest
+    )
+    if not os.path.exists(os.path.join(matrix_dir, "meta.json")):
+        build_turnover_feature_matrix(
+            notebook, stints, matrix_dir, lookback_months_list, from_year, to_year, n_jobs
+        )
+
+    with open(os.path.join(matrix_dir, "meta.json")) as file:
+        meta = json.load(file)
+    n_rows, columns = meta["rows"], meta["columns"]
+
+    def _memmap(name, dtype, shape):
+        if n_rows == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(os.path.join(matrix_dir, name), dtype=dtype, mode="r", shape=shape)
+
+    return (
+        _memmap("features.f32", np.float32, (n_rows, len(columns))),
+        _memmap("labels.i8", np.int8, (n_rows,)),
+        _memmap("months.i16", np.int16, (n_rows,)),
+        columns,
+    )
+
+
+def time_series_folds(months, n_splits: int = 3) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """(train, test) row indexes over rows sorted by month.
+
+    Each of the last `n_splits` years is tested on a model trained on the
+    months before it, but for the last: a month's label is whether the
+    professional leaves in the following month, so December's labels come
+    from the test year's January.
+    """
+    months = np.asarray(months, dtype=np.int64)
+    years = months // 12
+    folds = []
+    for year in np.unique(years)[1:][-n_splits:]:
+        start, stop = np.searchsorted(years, [year, year + 1])
+        # One month of embargo between the train and test rows
+        embargo = np.searchsorted(months, year * 12 - 1)
+        folds.append((np.arange(embargo), np.arange(start, stop)))
+    return folds
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """Peak resident memory of this process and its finished workers."""
+    if resource is None:
+        return None
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024**2 if sys.platform == "darwin" else 1024)
+
+
+def train_turnover_models(
+    features, labels, months, n_splits: int = 3, n_jobs: int = 1
+) -> pd.DataFrame:
+    """Cross-validate the models on time_series_folds.
+
+    The folds are fitted in `n_jobs` processes. Returns one row per model
+    with the ROC AUC of the folds, the mean fit time of a fold, the wall
+    time and the peak memory so far.
+    """
+    models = {
+        "Logistic regression": make_pipeline(
+            StandardScaler(), LogisticRegression(max_iter=1_000)
+        ),
+        "Gradient boosting": HistGradientBoostingClassifier(random_state=0),
+    }
+    folds = time_series_folds(months, n_splits)
+    if not folds:
+        raise ValueError("Time-based splits need at least two years of rows")
+
+    report = []
+    for name, model in models.items():
+        started = time.perf_counter()
+        scores = cross_validate(
+            model, features, labels, cv=folds, scoring="roc_auc", n_jobs=n_jobs
+        )
+        report.append(
+            {
+                "model": name,
+                "rows": len(labels),
+                "test_years": ", ".join(
+                    str(int(months[test[0]]) // 12 + 1970) for _, test in folds
+                ),
+                "auc_mean": scores["test_score"].mean(),
+                "auc_std": scores["test_score"].std(),
+                "fit_seconds_per_fold": scores["fit_time"].mean(),
+                "wall_seconds": time.perf_counter() - started,
+                "peak_rss_mb": _peak_rss_mb(),
+            }
+        )
+    return pd.DataFrame(report)
+
+
+def main(from_year: int, to_year: int, n_jobs: int) -> int:
+    with run_notebook() as notebook:
+        features, labels, months, _ = load_turnover_feature_matrix(
+            notebook,
+            notebook["encoded_sfc_professional_company_employment_history"],
+            notebook["sfc_history_fingerprint"],
+            from_year=from_year,
+            to_year=to_year,
+            n_jobs=n_jobs,
+        )
+        report = train_turnover_models(features, labels, months, n_jobs=n_jobs)
+    print(report.to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Train and cross-validate the turnover models of the "
+        "network-contagion notebook"
+    )
+    parser.add_argument("--from-year", type=int, default=2003, help="First snapshot year (default: 2003)")
+    parser.add_argument("--to-year", type=int, default=2026, help="Last snapshot year (default: 2026)")
+    parser.add_argument(
+        "--n-jobs",
+        type=int,
+        default=1,
+        help="Processes counting peer departures and fitting folds; -1 uses "
+        "every core (default: 1)",
+    )
+    args = parser.parse_args()
+    sys.exit(main(args.from_year, args.to_year, args.n_jobs))